@@ -1,18 +1,26 @@
 import streamlit as st
 import uuid
-from datetime import datetime
+from datetime import datetime, timezone
 from chatbot import LangGraphChat
+from core import resources
+from core.config import SESSIONS_PAGE_SIZE, METRICS_PANEL
 
 # Initialize session state variables
 def init_session_state():
     if 'chatbot' not in st.session_state:
         st.session_state.chatbot = LangGraphChat()
+        # Only the long-running app archives and compacts history; CLIs and benchmarks do not
+        st.session_state.chatbot.db.start_maintenance()
     
     if 'sessions' not in st.session_state:
         st.session_state.sessions = {}
+        st.session_state.session_pages = 1
+        st.session_state.sessions_version = None
+        st.session_state.has_more_sessions = False
         
-    # Load existing sessions from database
-    load_sessions_from_db()
+    # Reload the session list only when something was written since the last load
+    if st.session_state.sessions_version != st.session_state.chatbot.db.version:
+        load_sessions_from_db()
     
     # Create first session if no sessions exist
     if not st.session_state.sessions:
@@ -24,36 +32,62 @@ def init_session_state():
         st.session_state.current_session = next(iter(st.session_state.sessions))
 
 def load_sessions_from_db():
-    """Load all sessions from the database"""
+    """Load one query's worth of session summaries; messages are loaded when a session is opened"""
     try:
-        # Get all sessions from database
-        db_sessions = st.session_state.chatbot.db.get_all_sessions()
+        db = st.session_state.chatbot.db
+        version = db.version
+        limit = st.session_state.session_pages * SESSIONS_PAGE_SIZE
+        summaries = db.get_session_summaries(limit=limit + 1)
+        st.session_state.has_more_sessions = len(summaries) > limit
         
-        # Update session state with database sessions
-        for session_id, session_data in db_sessions.items():
-            messages = st.session_state.chatbot.db.get_chat_history(session_id)
-            
-            st.session_state.sessions[session_id] = {
-                'messages': [
-                    {
-                        'user_message': msg['user_message'],
-                        'response': msg['response'],
-                        'reference_docs': msg.get('reference_docs', [])
-                    }
-                    for msg in messages
-                ],
-                'created_at': session_data.get('created_at', datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
-                'name': session_data.get('name', f"Chat {len(st.session_state.sessions) + 1}")
+        sessions = {}
+        for summary in summaries[:limit]:
+            cached = st.session_state.sessions.get(summary['session_id'])
+            # Keep loaded messages unless the session changed since
+            keep = cached is not None and cached.get('message_count') == summary['message_count']
+            sessions[summary['session_id']] = {
+                'messages': cached['messages'] if keep else None,
+                'created_at': summary['created_at'],
+                'last_activity': summary['last_activity'],
+                'message_count': summary['message_count'],
+                'name': summary['name'],
+                # Archived sessions are restored by get_chat_history when opened
+                'archived': summary['archived']
             }
+        # A session opened from search may be older than the loaded pages
+        current = st.session_state.get('current_session')
+        if current in st.session_state.sessions and current not in sessions:
+            sessions[current] = {**st.session_state.sessions[current], 'messages': None}
+        st.session_state.sessions = sessions
+        st.session_state.sessions_version = version
     except Exception as e:
         st.error(f"Error loading sessions from database: {str(e)}")
 
+def load_messages(session_id):
+    """Load a session's messages the first time it is opened"""
+    session = st.session_state.sessions[session_id]
+    if session['messages'] is None:
+        messages = st.session_state.chatbot.db.get_chat_history(session_id)
+        session['messages'] = [
+            {
+                'user_message': msg['user_message'],
+                'response': msg['response'],
+                # Reference text is fetched only when the user opens it
+                'chat_id': msg['chat_id'],
+                'reference_ids': msg['reference_ids']
+            }
+            for msg in messages
+        ]
+    return session['messages']
+
 def create_session(session_id, name):
     """Create a new session and save it to both state and database"""
     # Create session in state
     st.session_state.sessions[session_id] = {
         'messages': [],
-        'created_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        # UTC, like every other timestamp in the chat database; idle sessions are archived against it
+        'created_at': datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+        'message_count': 0,
         'name': name
     }
     
@@ -66,6 +100,32 @@ def create_session(session_id, name):
         }
     )
 
+def open_search_hit(hit):
+    """Switch to the session of a search hit, adding it to the list if it is not on a loaded page"""
+    if hit['session_id'] not in st.session_state.sessions:
+        st.session_state.sessions[hit['session_id']] = {
+            'messages': None,
+            'created_at': hit['session_created_at'] or hit['timestamp'],
+            'message_count': None,
+            'name': hit['session_name'] or "Chat"
+        }
+    st.session_state.current_session = hit['session_id']
+
+def show_search_results(hits):
+    """Matching messages from all chats, each with a button that opens its chat"""
+    if not hits:
+        st.caption("No matching messages.")
+        return
+    for hit in hits:
+        if st.button(
+            f"{hit['session_name'] or 'Chat'} · {hit['timestamp'][:10]}",
+            key=f"search_hit_{hit['chat_id']}",
+            use_container_width=True
+        ):
+            open_search_hit(hit)
+            st.rerun()
+        st.caption(hit['snippet'])
+
 def create_new_chat():
     new_session_id = str(uuid.uuid4())
     new_chat_name = f"Chat {len(st.session_state.sessions) + 1}"
@@ -74,7 +134,38 @@ def create_new_chat():
 
 def format_session_name(session_id):
     session = st.session_state.sessions[session_id]
-    return f"{session['name']}"
+    return f"🗄️ {session['name']}" if session.get('archived') else f"{session['name']}"
+
+def show_references(references):
+    for ref_idx, reference in enumerate(references, 1):
+        st.markdown(f"**Content:**\n> {reference['page_content']}")
+        # st.markdown(f"**Metadata:**")
+        st.markdown(f"- **Page:** {reference['metadata']['page_label']}")
+        # st.markdown(f"- **Page Label:** {reference['metadata']['page_label']}")
+        st.markdown(f"- **Source:** `{reference['metadata']['source']}`")
+        st.markdown("---")  # Adds a separator between references
+
+def show_metrics():
+    """Rolling latency percentiles per workflow node, from the shared tracer"""
+    tracer = st.session_state.chatbot.tracer
+    stats = tracer.stats() if tracer else {}
+    if not stats:
+        st.caption("No turns traced yet.")
+        return
+    st.dataframe(
+        [{"span": name, "n": s["count"], "p50 ms": round(s["p50"]), "p95 ms": round(s["p95"]),
+          "p99 ms": round(s["p99"])} for name, s in stats.items()],
+        hide_index=True,
+        use_container_width=True
+    )
+
+def show_corpus_status(status):
+    """Corpus version, and progress while new documents are being ingested."""
+    if status["state"] == "ingesting":
+        st.caption(f"⏳ Ingesting documents ({status['files_done']}/{status['files_total']} files)...")
+    elif status["last_error"]:
+        st.caption(f"⚠️ Document ingestion failed: {status['last_error']}")
+    st.caption(f"📚 Corpus version {status['corpus_version']}")
 
 def main():
     # Initialize session state
@@ -90,12 +181,26 @@ def main():
     # Sidebar
     with st.sidebar:
         st.header("Chats")
+
+        if resources.error("retriever"):
+            st.error(f"Loading legal documents failed: {resources.error('retriever')}")
+        elif not resources.is_ready("retriever"):
+            st.caption("⏳ Loading legal documents in the background...")
+        elif resources.is_ready("watcher"):
+            show_corpus_status(resources.get_watcher().status())
         
         # New chat button
         if st.button("➕ New Chat", key="new_chat_button", type="primary"):
             create_new_chat()
             st.rerun()
         
+        # Full-text search over the chats in the hot database; archived ones are searched once reopened
+        search_query = st.text_input(
+            "🔍 Search chats", key="chat_search", placeholder="e.g. limitation period",
+            help="Archived chats (🗄️) are not searched until you open them.")
+        if search_query:
+            show_search_results(st.session_state.chatbot.db.search(search_query))
+        
         st.divider()
         
         # Session list
@@ -115,6 +220,15 @@ def main():
             ):
                 st.session_state.current_session = session_id
                 st.rerun()
+        
+        if st.session_state.has_more_sessions and st.button("Load older chats", key="more_sessions_button"):
+            st.session_state.session_pages += 1
+            st.session_state.sessions_version = None
+            st.rerun()
+        
+        if METRICS_PANEL:
+            with st.expander("⏱️ Latency"):
+                show_metrics()
     
     # Ensure we have a valid current session
     if st.session_state.current_session not in st.session_state.sessions:
@@ -134,7 +248,7 @@ def main():
     
     # Display chat history
     with chat_container:
-        for i, msg in enumerate(current_chat['messages'][::-1]):
+        for i, msg in enumerate(load_messages(st.session_state.current_session)[::-1]):
             with st.chat_message("user_message"):
                 st.write(msg['user_message'])
             
@@ -144,13 +258,12 @@ def main():
                 # reference_docs in collapsible section
                 if msg.get('reference_docs'):
                     with st.expander("📚 View References"):
-                        for ref_idx, reference in enumerate(msg['reference_docs'], 1):
-                            st.markdown(f"**Content:**\n> {reference['page_content']}")
-                            # st.markdown(f"**Metadata:**")
-                            st.markdown(f"- **Page:** {reference['metadata']['page_label']}")
-                            # st.markdown(f"- **Page Label:** {reference['metadata']['page_label']}")
-                            st.markdown(f"- **Source:** `{reference['metadata']['source']}`")
-                            st.markdown("---")  # Adds a separator between references
+                        show_references(msg['reference_docs'])
+                elif msg.get('reference_ids'):
+                    # Stored messages: expander bodies always run, so a toggle gates the lookup
+                    if st.toggle("📚 View References", key=f"references_{msg['chat_id']}"):
+                        msg['reference_docs'] = st.session_state.chatbot.db.get_references(msg['chat_id'])
+                        show_references(msg['reference_docs'])
     
     # User input
     user_message = st.chat_input("Type your message here...")
@@ -179,7 +292,7 @@ def main():
                         pass
                 
             # Once streaming is done, add the message to the chat history.
-            current_chat['messages'].append({
+            current_chat['messages'].insert(0, {
                 'user_message': user_message,
                 'response': full_response,
                 # Update reference_docs if your generator returns them.
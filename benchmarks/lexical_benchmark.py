@@ -0,0 +1,95 @@
+"""Benchmark the BM25 lexical index on a synthetic corpus.
+
+Measures bulk build, incremental add/delete, reopen time and search latency.
+
+Usage (from the project root):
+    python -m benchmarks.lexical_benchmark --chunks 300000
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+from core.lexical import BM25Index
+
+WORDS = ("court section act offence punishment contract liability negligence property tenant "
+         "landlord evidence appeal bail police witness inheritance divorce custody agreement "
+         "penalty fine imprisonment tribunal petition judgment decree rights article clause").split()
+
+
+def synthetic_chunk(rng: random.Random, words: int = 220) -> str:
+    tokens = []
+    for _ in range(words):
+        roll = rng.random()
+        if roll < 0.02:
+            tokens.append(str(rng.randint(1, 600)))
+        elif roll < 0.5:
+            tokens.append(rng.choice(WORDS))
+        else:
+            # Long tail vocabulary, Zipf-like
+            tokens.append(f"term{int(rng.paretovariate(1.1)) % 50000}")
+    return " ".join(tokens)
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=100000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=12)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    results = {"chunks": args.chunks}
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bm25.db")
+        index = BM25Index(path)
+
+        start = time.perf_counter()
+        for offset in range(0, args.chunks, args.batch_size):
+            count = min(args.batch_size, args.chunks - offset)
+            index.add([f"c{offset + i}" for i in range(count)], [synthetic_chunk(rng) for _ in range(count)])
+        results["build_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index.add([f"new{i}" for i in range(100)], [synthetic_chunk(rng) for _ in range(100)])
+        results["incremental_add_100_ms"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        index.delete([f"c{i}" for i in range(100)])
+        results["delete_100_ms"] = (time.perf_counter() - start) * 1000
+
+        queries = [f"section {rng.randint(1, 600)} {rng.choice(WORDS)}" for _ in range(args.queries // 2)]
+        queries += [f"{rng.choice(WORDS)} {rng.choice(WORDS)} term{rng.randint(1, 500)}" for _ in range(args.queries // 2)]
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            index.search(query, args.k)
+            latencies.append((time.perf_counter() - start) * 1000)
+        results["search_p50_ms"] = percentile(latencies, 50)
+        results["search_p99_ms"] = percentile(latencies, 99)
+
+        start = time.perf_counter()
+        index.compact()
+        results["compact_s"] = time.perf_counter() - start
+        start = time.perf_counter()
+        BM25Index(path)
+        results["reopen_s"] = time.perf_counter() - start
+        results["index_mb"] = os.path.getsize(path) / 2 ** 20
+
+    for key, value in results.items():
+        print(f"{key:<24}{value:>12.2f}" if isinstance(value, float) else f"{key:<24}{value:>12}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""Load test of the chat engine against the offline stand-in LLM.
+
+Runs N concurrent sessions, each asking a few questions, for every
+concurrency level, and reports latency and time to first token percentiles
+and throughput. "async" drives LangGraphChat.achat on one event loop,
+"threads" drives the blocking LangGraphChat.chat from a thread per session.
+
+Usage (from the project root):
+    python -m benchmarks.load_test --concurrency 1,8,32,128 --mode both --output load.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from benchmarks.pipeline_benchmark import latency_summary
+from benchmarks.offline import FakeChatModel, HashingEmbeddings, make_corpus
+from core import resources
+from core.config import PROCESSED_FOLDER
+
+
+def session_queries(session: int, turns: int) -> List[str]:
+    return [f"Session {session}: what does section {session * 7 + turn} say about negligence?" for turn in range(turns)]
+
+
+def summarize(mode: str, concurrency: int, results: List[Dict], seconds: float, threads: int) -> Dict:
+    result = {
+        "mode": mode,
+        "concurrency": concurrency,
+        "turns": len(results),
+        "turns_per_second": len(results) / seconds,
+        "latency": latency_summary([r["latency_ms"] for r in results]),
+        "time_to_first_token": latency_summary([r["first_token_ms"] for r in results]),
+        "peak_threads": threads,
+    }
+    print(f"{mode:>7} x{concurrency:<4} {result['turns_per_second']:7.1f} turns/s  "
+          f"p50 {result['latency']['p50_ms']:7.0f} ms  p99 {result['latency']['p99_ms']:7.0f} ms  "
+          f"ttft p50 {result['time_to_first_token']['p50_ms']:6.0f} ms  threads {threads}")
+    return result
+
+
+async def run_async(bot, concurrency: int, turns: int) -> Dict:
+    results = []
+    peak = threading.active_count()
+
+    async def session(number: int):
+        nonlocal peak
+        for query in session_queries(number, turns):
+            start = time.perf_counter()
+            first = None
+            async for update in bot.achat(query, f"load-async-{concurrency}-{number}"):
+                if first is None and "chunk" in update:
+                    first = time.perf_counter() - start
+            results.append({"latency_ms": (time.perf_counter() - start) * 1000, "first_token_ms": first * 1000})
+            peak = max(peak, threading.active_count())
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(n) for n in range(concurrency)))
+    return summarize("async", concurrency, results, time.perf_counter() - start, peak)
+
+
+def run_threads(bot, concurrency: int, turns: int) -> Dict:
+    results = []
+    peak = threading.active_count()
+
+    def session(number: int):
+        nonlocal peak
+        for query in session_queries(number, turns):
+            start = time.perf_counter()
+            first = None
+            for update in bot.chat(query, f"load-threads-{concurrency}-{number}"):
+                if first is None and "chunk" in update:
+                    first = time.perf_counter() - start
+            results.append({"latency_ms": (time.perf_counter() - start) * 1000, "first_token_ms": first * 1000})
+            peak = max(peak, threading.active_count())
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(session, range(concurrency)))
+    return summarize("threads", concurrency, results, time.perf_counter() - start, peak)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", default="1,4,16,64", help="Comma-separated concurrent session counts")
+    parser.add_argument("--turns", type=int, default=3, help="Questions per session")
+    parser.add_argument("--mode", choices=["async", "threads", "both"], default="both")
+    parser.add_argument("--files", type=int, default=5, help="Synthetic PDFs in the corpus")
+    parser.add_argument("--first-token-s", type=float, default=0.3, help="Fake LLM delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="Fake LLM streaming rate")
+    parser.add_argument("--answer-tokens", type=int, default=40)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="jurisguide-load-")
+    cwd = os.getcwd()
+    # Data paths in core.config are relative to the working directory
+    os.chdir(workdir)
+    try:
+        from chatbot import LangGraphChat
+        from core.retriever import DocumentRetriever
+
+        make_corpus(PROCESSED_FOLDER, args.files, pages=5)
+        embeddings = HashingEmbeddings()
+        resources.override(llm=FakeChatModel(first_token_s=args.first_token_s, tokens_per_s=args.tokens_per_second,
+                                             answer_tokens=args.answer_tokens),
+                           embeddings=embeddings)
+        retriever = DocumentRetriever(embeddings=embeddings, auto_ingest=False)
+        retriever.ingest()
+        resources.override(retriever=retriever)
+        bot = LangGraphChat()
+
+        results = []
+        for concurrency in [int(n) for n in args.concurrency.split(",")]:
+            if args.mode in ("async", "both"):
+                results.append(asyncio.run(run_async(bot, concurrency, args.turns)))
+            if args.mode in ("threads", "both"):
+                results.append(run_threads(bot, concurrency, args.turns))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "output"}, "results": results}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
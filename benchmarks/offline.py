@@ -0,0 +1,137 @@
+"""Offline stand-ins for the hosted LLM and the HuggingFace embedder, and a synthetic PDF corpus.
+
+Install them with core.resources.override() before the chatbot is created:
+
+    from benchmarks.offline import FakeChatModel, HashingEmbeddings
+    resources.override(llm=FakeChatModel(first_token_s=0.3), embeddings=HashingEmbeddings())
+"""
+import asyncio
+import hashlib
+import os
+import random
+import re
+import time
+from typing import AsyncIterator, Iterator, List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+ANSWER = ("Under the applicable provisions, negligence means a failure to take the care that a reasonable "
+          "person would take in the circumstances. The claimant must show a duty of care, a breach of that "
+          "duty and damage caused by the breach. Courts look at the foreseeability of harm, the relationship "
+          "between the parties and whether the loss is too remote. Limitation periods apply to such claims.")
+
+
+class FakeChatModel(BaseChatModel):
+    """Deterministic chat model with a configurable first-token delay and token rate.
+
+    Routing prompts get "True"; everything else gets the first `answer_tokens`
+    words of a fixed legal answer.
+    """
+
+    first_token_s: float = 0.2
+    tokens_per_s: float = 200.0
+    answer_tokens: int = 60
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _reply(self, messages) -> str:
+        prompt = messages[-1].content
+        if "determines whether" in prompt:
+            return "True"
+        return " ".join((ANSWER.split() * 4)[:self.answer_tokens])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply = self._reply(messages)
+        time.sleep(self.first_token_s + len(reply.split()) / self.tokens_per_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_s)
+        for word in self._reply(messages).split():
+            time.sleep(1 / self.tokens_per_s)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    # Native async versions, so concurrent async calls do not each hold a thread while "waiting on the API"
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        reply = self._reply(messages)
+        await asyncio.sleep(self.first_token_s + len(reply.split()) / self.tokens_per_s)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_s)
+        for word in self._reply(messages).split():
+            await asyncio.sleep(1 / self.tokens_per_s)
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class HashingEmbeddings(Embeddings):
+    """Bag-of-words feature hashing into a normalized vector; no model download."""
+
+    def __init__(self, dimensions: int = 384):
+        self.dimensions = dimensions
+
+    def _embed(self, text: str) -> List[float]:
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        for word in re.findall(r"[a-z0-9]+", text.lower()):
+            vector[int(hashlib.md5(word.encode()).hexdigest()[:8], 16) % self.dimensions] += 1
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+TOPICS = ("negligence", "contract", "tenancy", "inheritance", "bail", "custody", "defamation", "property",
+          "evidence", "appeal", "limitation", "murder", "theft", "fraud", "divorce", "employment")
+WORDS = ("court section act offence punishment liability tenant landlord witness police agreement penalty "
+         "fine imprisonment tribunal petition judgment decree rights article clause party claim damages "
+         "notice period provided whoever shall person accused complainant magistrate").split()
+
+
+def synthetic_page(rng: random.Random, words: int = 450) -> str:
+    topic = rng.choice(TOPICS)
+    tokens = [f"Section {rng.randint(1, 600)}.", topic.capitalize()]
+    for _ in range(words):
+        roll = rng.random()
+        tokens.append(topic if roll < 0.05 else str(rng.randint(1, 600)) if roll < 0.07 else rng.choice(WORDS))
+    return " ".join(tokens)
+
+
+def make_corpus(folder: str, files: int, pages: int = 10, start: int = 0, seed: int = 0) -> List[str]:
+    """Write synthetic legal-looking PDFs named doc{n}.pdf; returns their paths."""
+    import fitz
+
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for n in range(start, start + files):
+        rng = random.Random(seed * 1000003 + n)
+        document = fitz.open()
+        for _ in range(pages):
+            page = document.new_page()
+            page.insert_textbox(fitz.Rect(50, 50, 545, 790), synthetic_page(rng), fontsize=8)
+        path = os.path.join(folder, f"doc{n}.pdf")
+        document.save(path)
+        document.close()
+        paths.append(path)
+    return paths
+
+
+def synthetic_queries(count: int, seed: int = 1) -> List[str]:
+    rng = random.Random(seed)
+    return [f"What does section {rng.randint(1, 600)} say about {rng.choice(TOPICS)} and {rng.choice(WORDS)}?"
+            for _ in range(count)]
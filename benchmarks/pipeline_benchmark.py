@@ -0,0 +1,194 @@
+"""Offline benchmark of the whole chat pipeline.
+
+Runs without network access or model downloads. FakeChatModel stands in for
+ChatGroq and HashingEmbeddings for the HuggingFace embedder; the corpus is
+generated synthetic PDFs. Everything is written to a temporary directory.
+
+Measures:
+    ingest      DocumentRetriever.ingest throughput while the corpus grows
+    retrieval   retrieve_documents p50/p99 at each corpus size
+    database    ChatDatabase write throughput, read and full-text search p50/p99 at each table size
+    chat        LangGraphChat.chat end-to-end latency and time to first token
+
+Usage (from the project root):
+    python -m benchmarks.pipeline_benchmark --files 10,40 --db-rows 1000,20000 --output pipeline.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+# Settings are read when core.config is imported: keep the runs uncached and ingestion explicit
+os.environ.setdefault("INGEST_ON_STARTUP", "false")
+os.environ.setdefault("QUERY_CACHE_ENABLED", "false")
+os.environ.setdefault("ANSWER_CACHE_ENABLED", "false")
+os.environ.setdefault("CORPUS_WATCH", "false")
+
+from benchmarks.offline import TOPICS, FakeChatModel, HashingEmbeddings, make_corpus, synthetic_queries
+from core import resources
+from core.config import PROCESSED_FOLDER
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def timed_ms(fn, *args, **kwargs) -> float:
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000
+
+
+def latency_summary(latencies: List[float]) -> Dict[str, float]:
+    return {"p50_ms": percentile(latencies, 50), "p99_ms": percentile(latencies, 99)}
+
+
+def bench_corpus(retriever, file_steps: List[int], pages: int, queries: int, k: int) -> Dict[str, List[Dict]]:
+    ingest, retrieval = [], []
+    files = 0
+    for target in file_steps:
+        make_corpus(PROCESSED_FOLDER, target - files, pages=pages, start=files)
+        files = target
+        start = time.perf_counter()
+        stats = retriever.ingest()
+        seconds = time.perf_counter() - start
+        ingest.append({
+            "total_files": files,
+            "new_files": stats["files"],
+            "pages": stats["pages"],
+            "chunks": stats["chunks"],
+            "seconds": seconds,
+            "pages_per_second": stats["pages"] / seconds,
+            "chunks_per_second": stats["chunks"] / seconds,
+        })
+        latencies = [timed_ms(retriever.retrieve_documents, query, k) for query in synthetic_queries(queries)]
+        retrieval.append({"total_files": files, "chunks": retriever.store.count(), "k": k,
+                          **latency_summary(latencies)})
+        print(f"{files:>5} files: ingest {ingest[-1]['pages_per_second']:.1f} pages/s, "
+              f"retrieve p50 {retrieval[-1]['p50_ms']:.1f} ms p99 {retrieval[-1]['p99_ms']:.1f} ms")
+    return {"ingest": ingest, "retrieval": retrieval}
+
+
+def bench_database(path: str, row_steps: List[int], turns_per_session: int, reads: int) -> List[Dict]:
+    from langchain_core.documents import Document
+    from core.database import ChatDatabase
+
+    db = ChatDatabase(path)
+    rng = random.Random(0)
+    references = [Document(page_content=f"Reference chunk {i} " + "text " * 250,
+                           metadata={"source": f"doc{i % 20}.pdf", "page": i % 10, "page_label": str(i % 10)})
+                  for i in range(500)]
+    questions = synthetic_queries(1000, seed=2)
+    results, rows, sessions = [], 0, []
+    for target in row_steps:
+        save_latencies = []
+        start = time.perf_counter()
+        while rows < target:
+            if rows % turns_per_session == 0:
+                sessions.append(f"session-{len(sessions)}")
+                db.create_session(sessions[-1], {"name": f"Chat {len(sessions)}",
+                                                 "created_at": time.strftime("%Y-%m-%d %H:%M:%S")})
+            save_latencies.append(timed_ms(db.save_chat, sessions[-1], rng.choice(questions),
+                                           "The answer is as follows. " * 40, rng.sample(references, 3)))
+            rows += 1
+        db.flush()
+        write_seconds = time.perf_counter() - start
+
+        history = [timed_ms(db.get_chat_history, rng.choice(sessions)) for _ in range(reads)]
+        summaries = [timed_ms(db.get_session_summaries, 50) for _ in range(reads)]
+        searches = [timed_ms(db.search, f"section {rng.randint(1, 600)} {rng.choice(TOPICS)}") for _ in range(reads)]
+        results.append({
+            "rows": rows,
+            "sessions": len(sessions),
+            "save_chat_p99_ms": percentile(save_latencies, 99) if save_latencies else 0.0,
+            "writes_per_second": len(save_latencies) / write_seconds if save_latencies else 0.0,
+            "history_read": latency_summary(history),
+            "session_summaries": latency_summary(summaries),
+            "search": latency_summary(searches),
+            "file_mb": os.path.getsize(path) / 2 ** 20,
+        })
+        print(f"{rows:>8} rows: {results[-1]['writes_per_second']:.0f} writes/s, "
+              f"history p50 {results[-1]['history_read']['p50_ms']:.2f} ms, "
+              f"sessions p50 {results[-1]['session_summaries']['p50_ms']:.2f} ms, "
+              f"search p50 {results[-1]['search']['p50_ms']:.2f} ms")
+    return results
+
+
+def bench_chat(turns: int) -> Dict:
+    from chatbot import LangGraphChat
+
+    bot = LangGraphChat()
+    totals, first_tokens = [], []
+    for i, query in enumerate(synthetic_queries(turns, seed=2)):
+        start = time.perf_counter()
+        first = None
+        for update in bot.chat(query, f"bench-{i % 5}"):
+            if first is None and "chunk" in update:
+                first = time.perf_counter() - start
+        totals.append((time.perf_counter() - start) * 1000)
+        first_tokens.append(first * 1000)
+    result = {"turns": turns, "latency": latency_summary(totals), "time_to_first_token": latency_summary(first_tokens),
+              "speculation": bot.nodes.speculation_stats()}
+    print(f"chat: p50 {result['latency']['p50_ms']:.0f} ms, "
+          f"time to first token p50 {result['time_to_first_token']['p50_ms']:.0f} ms")
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", default="5,20", help="Comma-separated corpus sizes in PDF files")
+    parser.add_argument("--pages", type=int, default=10, help="Pages per synthetic PDF")
+    parser.add_argument("--queries", type=int, default=100, help="Retrieval queries per corpus size")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--db-rows", default="1000,10000", help="Comma-separated chats table sizes")
+    parser.add_argument("--turns-per-session", type=int, default=20)
+    parser.add_argument("--reads", type=int, default=200, help="Reads per database size")
+    parser.add_argument("--turns", type=int, default=20, help="End-to-end chat turns")
+    parser.add_argument("--first-token-s", type=float, default=0.2, help="Fake LLM delay before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0, help="Fake LLM streaming rate")
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--workdir", help="Keep data here instead of a temporary directory")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = args.workdir or tempfile.mkdtemp(prefix="jurisguide-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    cwd = os.getcwd()
+    # Data paths in core.config are relative to the working directory
+    os.chdir(workdir)
+    try:
+        from core.retriever import DocumentRetriever
+
+        llm = FakeChatModel(first_token_s=args.first_token_s, tokens_per_s=args.tokens_per_second,
+                            answer_tokens=args.answer_tokens)
+        embeddings = HashingEmbeddings()
+        resources.override(llm=llm, embeddings=embeddings)
+        retriever = DocumentRetriever(embeddings=embeddings, auto_ingest=False)
+        resources.override(retriever=retriever)
+
+        results = {
+            "config": {key: value for key, value in vars(args).items() if key not in ("workdir", "output")},
+            **bench_corpus(retriever, [int(n) for n in args.files.split(",")], args.pages, args.queries, args.k),
+            "database": bench_database(os.path.join("bench", "chat_history.db"),
+                                       [int(n) for n in args.db_rows.split(",")], args.turns_per_session,
+                                       args.reads),
+            "chat": bench_chat(args.turns),
+        }
+    finally:
+        os.chdir(cwd)
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
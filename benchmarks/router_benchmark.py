@@ -0,0 +1,118 @@
+"""Compare the local retrieval routers against the LLM router.
+
+Accuracy is reported on two labelled sets: the tuning set the lexical rules and
+embedding seeds were written against, and a held-out set that was not used for
+tuning. Quote the held-out numbers.
+
+Usage (from the project root):
+    python -m benchmarks.router_benchmark                 # lexical router vs labels and LLM
+    python -m benchmarks.router_benchmark --embeddings    # also load HuggingFaceEmbeddings
+    python -m benchmarks.router_benchmark --no-llm        # offline, labels only
+"""
+import argparse
+import json
+import os
+import time
+from typing import Callable, Dict, List
+
+from core.router import EmbeddingRouter, LexicalRouter, LLMRouter, RetrievalRouter
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+QUERY_SETS = {
+    "tuning": os.path.join(BENCHMARK_DIR, "router_queries_tuning.jsonl"),
+    "held-out": os.path.join(BENCHMARK_DIR, "router_queries_heldout.jsonl"),
+}
+
+
+def load_queries(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(name: str, decide: Callable[[str], bool], queries: List[Dict]) -> Dict:
+    decisions, latencies = [], []
+    for item in queries:
+        start = time.perf_counter()
+        decisions.append(bool(decide(item["query"])))
+        latencies.append((time.perf_counter() - start) * 1000)
+    correct = sum(d == item["requires_retrieval"] for d, item in zip(decisions, queries))
+    return {
+        "router": name,
+        "decisions": decisions,
+        "accuracy": correct / len(queries),
+        "mean_ms": sum(latencies) / len(latencies),
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+    }
+
+
+def evaluate(queries: List[Dict], stages: List, llm_router, threshold: float) -> List[Dict]:
+    results = [run(stage.name, lambda q, s=stage: s.predict(q)[0], queries) for stage in stages]
+
+    combined = RetrievalRouter(stages, llm_fallback=llm_router, threshold=threshold)
+    results.append(run("local+fallback" if llm_router else "local", combined.route, queries))
+    results[-1]["routing"] = combined.stats()
+
+    if llm_router:
+        reference = run("llm", llm_router, queries)
+        results.append(reference)
+        for result in results:
+            agree = sum(a == b for a, b in zip(result["decisions"], reference["decisions"]))
+            result["llm_agreement"] = agree / len(queries)
+    return results
+
+
+def print_results(title: str, results: List[Dict], stage_count: int):
+    print(f"{title}\n")
+    print(f"{'router':<16}{'accuracy':>10}{'llm agree':>11}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for result in results:
+        agreement = result.get("llm_agreement")
+        print(f"{result['router']:<16}{result['accuracy']:>10.1%}"
+              f"{(f'{agreement:.1%}' if agreement is not None else '-'):>11}"
+              f"{result['mean_ms']:>10.2f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}")
+    routing = results[stage_count]["routing"]
+    print(f"\nUncertain locally: {routing['uncertain']} of {routing['total']} queries, "
+          f"LLM fallback rate: {routing['fallback_rate']:.1%}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--queries", help="Labelled JSONL query set to use instead of the tuning and held-out sets")
+    parser.add_argument("--embeddings", action="store_true", help="Benchmark the embedding router too")
+    parser.add_argument("--no-llm", action="store_true", help="Skip the LLM router (fully offline)")
+    parser.add_argument("--threshold", type=float, default=0.6, help="Local router confidence threshold")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    query_sets = {"custom": args.queries} if args.queries else QUERY_SETS
+    stages = [LexicalRouter()]
+    if args.embeddings:
+        from langchain_huggingface import HuggingFaceEmbeddings
+        embedding_router = EmbeddingRouter(HuggingFaceEmbeddings())
+        embedding_router.predict("warm up")
+        stages.append(embedding_router)
+
+    llm_router = None
+    if not args.no_llm:
+        from core.models import ResponseGenerator
+        llm_router = LLMRouter(ResponseGenerator())
+
+    all_results = {}
+    for name, path in query_sets.items():
+        queries = load_queries(path)
+        all_results[name] = evaluate(queries, stages, llm_router, args.threshold)
+        print_results(f"{name}: {len(queries)} labelled queries from {path}", all_results[name], len(stages))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(all_results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
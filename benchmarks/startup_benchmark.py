@@ -0,0 +1,63 @@
+"""Measure application startup time in fresh interpreter processes.
+
+Reports, per run and as medians:
+    import_s      importing chatbot (what Streamlit pays before rendering)
+    construct_s   LangGraphChat() construction
+    ready_s       until the background warm-up has loaded the retriever and LLM
+    rss_mb        peak resident memory of the process
+
+Usage (from the project root):
+    python -m benchmarks.startup_benchmark --runs 5 --output startup.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+PROBE = r"""
+import json, resource, time
+start = time.perf_counter()
+import chatbot
+imported = time.perf_counter()
+bot = chatbot.LangGraphChat()
+constructed = time.perf_counter()
+from core import resources
+for name in ("retriever", "llm"):
+    resources.wait_ready(name)
+ready = time.perf_counter()
+print(json.dumps({
+    "import_s": imported - start,
+    "construct_s": constructed - imported,
+    "ready_s": ready - start,
+    "rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="Fresh processes to start")
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        result = subprocess.run([sys.executable, "-c", PROBE], capture_output=True, text=True)
+        if result.returncode != 0:
+            # e.g. a resource failed to load during warm-up
+            sys.exit(f"run {i + 1} failed:\n{result.stderr.strip()}")
+        # The probe's JSON is its last stdout line; ingestion progress may precede it
+        runs.append(json.loads(result.stdout.strip().splitlines()[-1]))
+        print(f"run {i + 1}: " + ", ".join(f"{k}={v:.2f}" for k, v in runs[-1].items()))
+
+    summary = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+    print("median: " + ", ".join(f"{k}={v:.2f}" for k, v in summary.items()))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"runs": runs, "median": summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
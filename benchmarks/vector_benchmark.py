@@ -0,0 +1,155 @@
+"""Vector store benchmark: Chroma against the memory-mapped index.
+
+Builds each store from the same synthetic clustered embeddings, then opens it
+in a fresh process (as a new app worker would) and measures open time, query
+latency, batched query throughput, recall@k against exact float32 search, and
+memory. Memory is reported as total RSS and as the anonymous (private) part;
+pages of the memory-mapped file are shared by every process that opens it.
+
+Usage (from the project root):
+    python -m benchmarks.vector_benchmark --vectors 10000,100000 --output vectors.json
+"""
+import argparse
+import json
+import math
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.pipeline_benchmark import latency_summary
+
+
+def clustered_vectors(centres: np.ndarray, count: int, rng: np.random.Generator, noise: float = 0.6) -> np.ndarray:
+    """Unit vectors around random topic centres, like sentence embeddings of a corpus and its queries."""
+    vectors = centres[rng.integers(len(centres), size=count)]
+    vectors = vectors + noise * rng.normal(size=vectors.shape).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def memory_mb() -> Dict[str, float]:
+    """Resident memory of this process from /proc; anon excludes file-backed (shared) pages."""
+    fields = {}
+    with open("/proc/self/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "RssAnon"):
+                fields[key] = int(value.split()[0]) / 1024
+    return {"rss_mb": fields.get("VmRSS", 0.0), "anon_mb": fields.get("RssAnon", 0.0)}
+
+
+def open_store(backend: str, path: str, ivf_lists: int, probes: int):
+    from benchmarks.offline import HashingEmbeddings
+    from core.vectorstore import ChromaVectorStore, MmapVectorStore
+
+    if backend == "chroma":
+        return ChromaVectorStore(HashingEmbeddings(), path)
+    return MmapVectorStore(path, dtype=backend.split("-")[1], ivf_lists=ivf_lists, probes=probes)
+
+
+def build(backend: str, path: str, vectors: np.ndarray, ivf_lists: int, probes: int, batch_size: int = 1000) -> float:
+    store = open_store(backend, path, ivf_lists, probes)
+    start = time.perf_counter()
+    for offset in range(0, len(vectors), batch_size):
+        batch = vectors[offset:offset + batch_size]
+        ids = [str(offset + i) for i in range(len(batch))]
+        store.upsert(ids, batch.tolist(), [f"chunk {i}" for i in ids], [{"source": "bench.pdf"} for _ in ids])
+    if backend.endswith("-ivf") and getattr(store, "centroids", None) is None:
+        store.train()
+    return time.perf_counter() - start
+
+
+def measure(backend: str, path: str, queries: np.ndarray, k: int, ivf_lists: int, probes: int, results):
+    """Runs in a fresh process: open the store, then query it."""
+    import core.vectorstore  # noqa: F401  Imports are not part of the open time
+
+    before = memory_mb()
+    start = time.perf_counter()
+    store = open_store(backend, path, ivf_lists, probes)
+    store.search(queries[:1].tolist(), k)
+    open_ms = (time.perf_counter() - start) * 1000
+
+    latencies, found = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits = store.search([query.tolist()], k)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        found.append([int(chunk_id) for chunk_id, _, _ in hits])
+    start = time.perf_counter()
+    store.search(queries.tolist(), k)
+    batch_seconds = time.perf_counter() - start
+    after = memory_mb()
+    results.put({
+        "open_ms": open_ms,
+        "query": latency_summary(latencies),
+        "batch_queries_per_second": len(queries) / batch_seconds,
+        "rss_mb": after["rss_mb"] - before["rss_mb"],
+        "anon_mb": after["anon_mb"] - before["anon_mb"],
+        "found": found,
+    })
+
+
+def recall(found: List[List[int]], truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    return float(np.mean([len(set(ids) & set(expected.tolist())) / k for ids, expected in zip(found, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--vectors", default="10000,50000", help="Comma-separated index sizes")
+    parser.add_argument("--dimensions", type=int, default=768, help="768 matches the default HuggingFace model")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--backends", default="chroma,mmap-float16,mmap-int8,mmap-int8-ivf")
+    parser.add_argument("--ivf-lists", type=int, help="Coarse lists for -ivf backends (default: sqrt of the size)")
+    parser.add_argument("--probes", type=int, default=16)
+    parser.add_argument("--output", help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="jurisguide-vectors-")
+    context = multiprocessing.get_context("spawn")
+    results = []
+    try:
+        for size in [int(n) for n in args.vectors.split(",")]:
+            rng = np.random.default_rng(0)
+            centres = rng.normal(size=(max(1, size // 100), args.dimensions)).astype(np.float32)
+            vectors = clustered_vectors(centres, size, rng)
+            queries = clustered_vectors(centres, args.queries, rng)
+            truth = np.argsort(-(queries @ vectors.T), axis=1)[:, :args.k]
+            ivf_lists = args.ivf_lists or int(math.sqrt(size))
+
+            for backend in args.backends.split(","):
+                path = os.path.join(workdir, f"{backend}-{size}")
+                build_seconds = build(backend, path, vectors, ivf_lists if backend.endswith("-ivf") else 0,
+                                      args.probes)
+                queue = context.Queue()
+                process = context.Process(target=measure, args=(backend, path, queries, args.k,
+                                                                ivf_lists if backend.endswith("-ivf") else 0,
+                                                                args.probes, queue))
+                process.start()
+                measured = queue.get()
+                process.join()
+                result = {"backend": backend, "vectors": size, "dimensions": args.dimensions,
+                          "build_seconds": build_seconds, "recall": recall(measured.pop("found"), truth),
+                          **measured}
+                results.append(result)
+                print(f"{backend:>14} {size:>8}: recall@{args.k} {result['recall']:.3f}  "
+                      f"open {result['open_ms']:7.0f} ms  p50 {result['query']['p50_ms']:6.2f} ms  "
+                      f"p99 {result['query']['p99_ms']:6.2f} ms  batch {result['batch_queries_per_second']:7.0f} q/s  "
+                      f"rss +{result['rss_mb']:.0f} MB (private +{result['anon_mb']:.0f} MB)  "
+                      f"build {build_seconds:.1f}s")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"config": {k: v for k, v in vars(args).items() if k != "output"}, "results": results}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,9 @@
-from typing import Dict
-from core.database import ChatDatabase
-from core.models import create_workflow
-from core.config import HISTORY_CONTEXT
+import asyncio
+from typing import AsyncIterator, Dict, List, Optional
+from core import resources
+from core.models import ChatNodes, create_workflow
+from core.config import LLM_MODEL, ANSWER_CACHE_ENABLED, TRACING_ENABLED
+import time
 import types
 import uuid
 
@@ -10,34 +12,167 @@ import uuid
 # Chat Interface
 class LangGraphChat:
     def __init__(self):
-        self.workflow = create_workflow()
-        self.db = ChatDatabase()
+        self.nodes = ChatNodes()
+        self.workflow = create_workflow(self.nodes)
+        self.async_workflow = create_workflow(self.nodes, asynchronous=True)
+        self.db = self.nodes.db
+        # Shared by all browser sessions, so an answer stored by one is found by the others
+        self.answer_cache = resources.get_answer_cache() if ANSWER_CACHE_ENABLED else None
+        self.tracer = resources.get_tracer() if TRACING_ENABLED else None
+        # Load the embedding model and vector store without blocking the UI
+        resources.warm_up()
 
-    def chat(self, user_message: str, session_id: str = None):
-        session_id = session_id or str(uuid.uuid4())
-        history = self.db.get_chat_history(session_id, limit=HISTORY_CONTEXT)
-        initial_state = {
+    @staticmethod
+    def _final_payload(session_id: str, response: str, reference_docs, cached: bool = False,
+                       trace_id: str = None) -> Dict:
+        return {
+            "final": True,
+            "session_id": session_id,
+            "response": response,
+            "cached": cached,
+            "trace_id": trace_id,
+            "reference_docs": [
+                {"page_content": doc.page_content, "metadata": doc.metadata}
+                for doc in reference_docs
+            ]
+        }
+
+    def _lookup_answer(self, user_message: str, session_id: str) -> Dict:
+        """Near-duplicate questions against the same corpus and model can reuse an earlier answer.
+
+        Only the opening question of a session is looked up: later turns are answered with
+        the conversation (history and summary) in the prompt, which the cache key does not cover.
+        """
+        if not self.answer_cache or self.db.get_chat_history(session_id, limit=1):
+            return {"cached": None}
+        corpus_version = self.nodes.retriever.corpus_version
+        query_vector = self.answer_cache.embed(user_message)
+        cached = self.answer_cache.lookup(query_vector, corpus_version, LLM_MODEL)
+        return {"cached": cached, "query_vector": query_vector, "corpus_version": corpus_version}
+
+    def _cached_reply(self, user_message: str, session_id: str, trace_id: str, cached: Dict) -> List[Dict]:
+        self.db.save_chat(session_id, user_message, cached["response"],
+                          reference_docs=cached["reference_docs"], trace_id=trace_id)
+        return [
+            {"chunk": cached["response"], "full_response": cached["response"]},
+            self._final_payload(session_id, cached["response"], cached["reference_docs"], cached=True,
+                                trace_id=trace_id)
+        ]
+
+    @staticmethod
+    def _initial_state(user_message: str, session_id: str, trace_id: str) -> Dict:
+        return {
             "session_id": session_id,
             "user_message": user_message,
             "reference_docs": [],
             "response": "",
-            "history": [
-                {"user_message": h['user_message'], "response": h["response"], "reference_docs": h['reference_docs']}
-                for h in history
-            ]
+            "trace_id": trace_id,
+            # Keys the run's speculative work, so it can be released if the run fails
+            "run_id": trace_id,
         }
-        full_response = ""
-        print("Generator ", self.workflow.stream(initial_state))
-        print("Type", type(self.workflow.stream(initial_state)))
-        # This is your generator streaming updates
-        for update in self.workflow.stream(initial_state):
-            # Check if a response chunk is available
-            if "generate" in update:
-                chunk = update["generate"].get("response", "")
-                full_response += chunk
-                # Yield the chunk for streaming
-                yield {"chunk": chunk, "full_response": full_response}
-            # You can also yield final payloads or metadata as needed.
-        # Optionally yield a final payload with metadata at the end.
-        yield {"final": True, "session_id": session_id, "response": full_response, "reference_docs": []}
-    
\ No newline at end of file
+
+    def _store_answer(self, turn: "_Turn", user_message: str, lookup: Dict):
+        # Only standalone knowledge questions are cached: opening questions (the only ones
+        # looked up) that needed retrieval; small talk depends on the conversation
+        if self.answer_cache and "query_vector" in lookup and turn.requires_retrieval and turn.full_response:
+            self.answer_cache.store(user_message, lookup["query_vector"], turn.full_response, turn.reference_docs,
+                                    lookup["corpus_version"], LLM_MODEL)
+
+    def chat(self, user_message: str, session_id: str = None):
+        """Stream a reply; the whole turn and time to first token are recorded under one trace ID."""
+        turn = _Turn(self.tracer, session_id or str(uuid.uuid4()))
+        for update in self._chat(user_message, turn):
+            turn.observe(update)
+            yield update
+
+    def _chat(self, user_message: str, turn: "_Turn"):
+        lookup = self._lookup_answer(user_message, turn.session_id)
+        if lookup["cached"]:
+            yield from self._cached_reply(user_message, turn.session_id, turn.trace_id, lookup["cached"])
+            return
+
+        initial_state = self._initial_state(user_message, turn.session_id, turn.trace_id)
+        if not self.nodes.speculative:
+            # In speculative mode the nodes load history while the router runs
+            initial_state.update(self.nodes.load_history(turn.session_id))
+        # Single pass over the graph: "custom" carries generated tokens, "updates" carries node outputs
+        try:
+            for mode, update in self.workflow.stream(initial_state, stream_mode=["custom", "updates"]):
+                chunk = turn.on_stream(mode, update)
+                if chunk:
+                    yield chunk
+        finally:
+            self.nodes.discard_speculation(initial_state["run_id"])
+
+        self._store_answer(turn, user_message, lookup)
+        yield self._final_payload(turn.session_id, turn.full_response, turn.reference_docs, trace_id=turn.trace_id)
+
+    async def achat(self, user_message: str, session_id: str = None) -> AsyncIterator[Dict]:
+        """Async version of chat(), yielding the same updates, for use with `async for`.
+
+        Runs the async workflow: the LLM is awaited and blocking steps (embedding,
+        search, database reads) run in worker threads, so one event loop can serve
+        many sessions at once.
+        """
+        turn = _Turn(self.tracer, session_id or str(uuid.uuid4()))
+        async for update in self._achat(user_message, turn):
+            turn.observe(update)
+            yield update
+
+    async def _achat(self, user_message: str, turn: "_Turn"):
+        lookup = await asyncio.to_thread(self._lookup_answer, user_message, turn.session_id)
+        if lookup["cached"]:
+            for update in self._cached_reply(user_message, turn.session_id, turn.trace_id, lookup["cached"]):
+                yield update
+            return
+
+        initial_state = self._initial_state(user_message, turn.session_id, turn.trace_id)
+        if not self.nodes.speculative:
+            initial_state.update(await self.nodes.aload_history(turn.session_id))
+        try:
+            async for mode, update in self.async_workflow.astream(initial_state, stream_mode=["custom", "updates"]):
+                chunk = turn.on_stream(mode, update)
+                if chunk:
+                    yield chunk
+        finally:
+            self.nodes.discard_speculation(initial_state["run_id"])
+
+        await asyncio.to_thread(self._store_answer, turn, user_message, lookup)
+        yield self._final_payload(turn.session_id, turn.full_response, turn.reference_docs, trace_id=turn.trace_id)
+
+
+class _Turn:
+    """Per-turn state shared by chat() and achat(): accumulated output and turn tracing."""
+
+    def __init__(self, tracer, session_id: str):
+        self.tracer = tracer
+        self.session_id = session_id
+        self.trace_id = uuid.uuid4().hex
+        self.start = time.perf_counter()
+        self.first_token_ms = None
+        self.full_response = ""
+        self.reference_docs = []
+        self.requires_retrieval = False
+
+    def on_stream(self, mode: str, update: Dict) -> Optional[Dict]:
+        """Fold one workflow stream item into the turn; returns the chunk update to yield, if any."""
+        if mode == "custom" and "token" in update:
+            self.full_response += update["token"]
+            return {"chunk": update["token"], "full_response": self.full_response}
+        if mode == "updates" and "decide_retrieval" in update:
+            self.requires_retrieval = update["decide_retrieval"].get("requires_retrieval", False)
+        elif mode == "updates" and "retrieve" in update:
+            self.reference_docs = update["retrieve"].get("reference_docs") or []
+        return None
+
+    def observe(self, update: Dict):
+        if self.first_token_ms is None and "chunk" in update:
+            self.first_token_ms = (time.perf_counter() - self.start) * 1000
+            if self.tracer:
+                self.tracer.record(self.trace_id, "first_token", self.first_token_ms)
+        if update.get("final") and self.tracer:
+            self.tracer.record(self.trace_id, "turn", (time.perf_counter() - self.start) * 1000, {
+                "session_id": self.session_id,
+                "cached": update["cached"],
+                "first_token_ms": self.first_token_ms
+            })
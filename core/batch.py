@@ -0,0 +1,275 @@
+"""Batch question answering.
+
+Runs questions from a JSONL or CSV file through the chat workflow with bounded
+concurrency, a token-bucket limit on LLM requests and tokens, and retries with
+backoff. Results are appended to a JSONL file as they finish; rerunning with
+the same output file skips questions that already have an answer.
+
+Usage (from the project root):
+    python -m core.batch questions.jsonl --output answers.jsonl --concurrency 4
+"""
+import os
+import re
+import csv
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import threading
+import uuid
+from typing import Any, Dict, Iterator, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from . import resources
+from .context import count_tokens
+from .config import (BATCH_CONCURRENCY, BATCH_MAX_RETRIES, LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE,
+                     RESPONSE_TOKEN_RESERVE)
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most capacity tokens.
+
+    Callers reserve tokens and then sleep until the reservation is covered, so
+    waiting callers are served in arrival order. Usable from threads and event loops.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60
+        self.capacity = capacity or rate_per_minute
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Take tokens, possibly going into debt; returns the seconds to wait before using them."""
+        tokens = min(tokens, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return max(0.0, -self._tokens / self.rate)
+
+    def acquire(self, tokens: float = 1):
+        time.sleep(self._reserve(tokens))
+
+    async def aacquire(self, tokens: float = 1):
+        await asyncio.sleep(self._reserve(tokens))
+
+
+class RateLimitedChatModel(BaseChatModel):
+    """Chat model wrapper that waits for request and token budget before every call.
+
+    Tokens are the estimated prompt size plus RESPONSE_TOKEN_RESERVE, matching
+    how providers such as Groq count requests and tokens per minute.
+    """
+
+    model: BaseChatModel
+    requests: Any
+    tokens: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"rate-limited-{self.model._llm_type}"
+
+    def _cost(self, messages) -> int:
+        return sum(count_tokens(str(m.content)) for m in messages) + RESPONSE_TOKEN_RESERVE
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        self.requests.acquire()
+        self.tokens.acquire(self._cost(messages))
+        return self.model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await self.requests.aacquire()
+        await self.tokens.aacquire(self._cost(messages))
+        return await self.model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        self.requests.acquire()
+        self.tokens.acquire(self._cost(messages))
+        for chunk in self.model.stream(messages, stop=stop, **kwargs):
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(generation.text, chunk=generation)
+            yield generation
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await self.requests.aacquire()
+        await self.tokens.aacquire(self._cost(messages))
+        async for chunk in self.model.astream(messages, stop=stop, **kwargs):
+            generation = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(generation.text, chunk=generation)
+            yield generation
+
+
+def normalize_question(question: str) -> str:
+    return re.sub(r"\s+", " ", question).strip().lower()
+
+
+def read_questions(path: str) -> List[Dict]:
+    """Questions from JSONL ({"question": ..., "id": ...}) or CSV with a question column; IDs default to the row number."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith(".csv"):
+            rows = list(csv.DictReader(f))
+        else:
+            rows = [json.loads(line) for line in f if line.strip()]
+    questions = []
+    for number, row in enumerate(rows, 1):
+        question = row.get("question") or row.get("query")
+        if question:
+            questions.append({"id": str(row.get("id") or number), "question": question})
+    return questions
+
+
+def read_completed(path: str) -> Dict[str, Dict]:
+    """Answered records of an earlier run, by question ID; failed ones are retried."""
+    completed = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # Partial last line of an interrupted run
+                if "answer" in record:
+                    completed[record["id"]] = record
+    return completed
+
+
+def _ends_mid_line(path: str) -> bool:
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return False
+    with open(path, "rb") as f:
+        f.seek(-1, os.SEEK_END)
+        return f.read(1) != b"\n"
+
+
+class BatchRunner:
+    """Answers a list of questions with the async chat engine."""
+
+    def __init__(self, chatbot, output_path: str, concurrency: int = BATCH_CONCURRENCY,
+                 max_retries: int = BATCH_MAX_RETRIES):
+        self.chatbot = chatbot
+        self.output_path = output_path
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.stats = {"questions": 0, "duplicates": 0, "resumed": 0, "answered": 0, "failed": 0, "retries": 0}
+
+    def _write(self, output, record: Dict):
+        output.write(json.dumps(record, ensure_ascii=False) + "\n")
+        output.flush()
+
+    async def _answer(self, item: Dict) -> Dict:
+        """One question as its own session, retried with exponential backoff and jitter.
+
+        Every attempt gets a fresh session: a retry, a rerun or a resumed run reusing one
+        would find earlier answers in its history, and would skip the answer cache.
+        """
+        for attempt in range(1, self.max_retries + 2):
+            start = time.perf_counter()
+            first_token_ms = None
+            session_id = f"batch-{item['id']}-{uuid.uuid4().hex[:12]}"
+            try:
+                async for update in self.chatbot.achat(item["question"], session_id):
+                    if first_token_ms is None and "chunk" in update:
+                        first_token_ms = (time.perf_counter() - start) * 1000
+                final = update
+                return {
+                    "id": item["id"],
+                    "question": item["question"],
+                    "answer": final["response"],
+                    "references": [
+                        {"source": doc["metadata"].get("source"), "page": doc["metadata"].get("page_label"),
+                         "page_content": doc["page_content"]}
+                        for doc in final["reference_docs"]
+                    ],
+                    "cached": final["cached"],
+                    "session_id": session_id,
+                    "trace_id": final["trace_id"],
+                    "timings": {"total_ms": (time.perf_counter() - start) * 1000,
+                                "first_token_ms": first_token_ms, "attempts": attempt},
+                }
+            except Exception as e:
+                if attempt > self.max_retries:
+                    return {"id": item["id"], "question": item["question"], "error": str(e),
+                            "timings": {"attempts": attempt}}
+                self.stats["retries"] += 1
+                delay = min(60.0, 2 ** attempt) * (0.5 + random.random() / 2)
+                print(f"[batch] {item['id']}: {e!r}, retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+    async def run(self, questions: List[Dict]) -> Dict:
+        completed = read_completed(self.output_path)
+        # Identical questions are answered once; the copies reuse the answer
+        originals: Dict[str, Dict] = {}
+        copies: Dict[str, List[Dict]] = {}
+        for item in questions:
+            key = normalize_question(item["question"])
+            if key in originals:
+                copies.setdefault(originals[key]["id"], []).append(item)
+                self.stats["duplicates"] += 1
+            else:
+                originals[key] = item
+        self.stats["questions"] = len(questions)
+
+        queue: asyncio.Queue = asyncio.Queue()
+        with open(self.output_path, "a", encoding="utf-8") as output:
+            if _ends_mid_line(self.output_path):
+                output.write("\n")  # Keep the partial line of an interrupted run apart from new records
+            for item in originals.values():
+                if item["id"] in completed:
+                    self.stats["resumed"] += 1
+                    self._write_copies(output, completed[item["id"]], copies.get(item["id"], []), completed)
+                else:
+                    queue.put_nowait(item)
+
+            async def worker():
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    record = await self._answer(item)
+                    self.stats["answered" if "answer" in record else "failed"] += 1
+                    self._write(output, record)
+                    self._write_copies(output, record, copies.get(item["id"], []), completed)
+                    done = self.stats["answered"] + self.stats["failed"]
+                    print(f"[batch] {done}/{len(originals) - self.stats['resumed']} answered")
+
+            await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+        return self.stats
+
+    def _write_copies(self, output, record: Dict, items: List[Dict], completed: Dict[str, Dict]):
+        for item in items:
+            if item["id"] not in completed:
+                self._write(output, {**record, "id": item["id"], "question": item["question"],
+                                     "duplicate_of": record["id"]})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input", help="Questions as JSONL or CSV")
+    parser.add_argument("--output", required=True, help="JSONL file for answers; reused to resume")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Questions in flight")
+    parser.add_argument("--requests-per-minute", type=float, default=LLM_REQUESTS_PER_MINUTE)
+    parser.add_argument("--tokens-per-minute", type=float, default=LLM_TOKENS_PER_MINUTE)
+    parser.add_argument("--max-retries", type=int, default=BATCH_MAX_RETRIES)
+    args = parser.parse_args(argv)
+
+    from chatbot import LangGraphChat
+
+    resources.override(llm=RateLimitedChatModel(
+        model=resources.get_llm(),
+        requests=TokenBucket(args.requests_per_minute),
+        tokens=TokenBucket(args.tokens_per_minute)
+    ))
+    runner = BatchRunner(LangGraphChat(), args.output, args.concurrency, args.max_retries)
+    stats = asyncio.run(runner.run(read_questions(args.input)))
+    print(", ".join(f"{key}: {value}" for key, value in stats.items()))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
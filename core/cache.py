@@ -0,0 +1,254 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .config import ANSWER_CACHE_PATH, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE
+
+
+# Persistent Key/Value Cache
+class PersistentLRUCache:
+    """In-memory LRU in front of a size-bounded SQLite table of bytes values.
+
+    Each entry records how long it took to compute, so hits can report the time saved.
+    """
+
+    def __init__(self, path: str, table: str, memory_size: int, disk_size: int):
+        self.table = table
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "saved_ms": 0.0}
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key TEXT PRIMARY KEY,
+                value BLOB,
+                cost_ms REAL,
+                last_used REAL
+            )
+        """)
+        self.conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_last_used ON {table} (last_used)")
+        self.conn.commit()
+
+    def _remember(self, key: str, value: bytes, cost_ms: float):
+        self._memory[key] = (value, cost_ms)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                value, cost_ms = self._memory[key]
+                self.counters["memory_hits"] += 1
+                self.counters["saved_ms"] += cost_ms
+                return value
+
+            row = self.conn.execute(f"SELECT value, cost_ms FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.counters["misses"] += 1
+                return None
+            self.conn.execute(f"UPDATE {self.table} SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.conn.commit()
+            self._remember(key, row[0], row[1])
+            self.counters["disk_hits"] += 1
+            self.counters["saved_ms"] += row[1]
+            return row[0]
+
+    def put(self, key: str, value: bytes, cost_ms: float):
+        with self._lock:
+            self._remember(key, value, cost_ms)
+            self.conn.execute(f"""
+                INSERT OR REPLACE INTO {self.table} (key, value, cost_ms, last_used) VALUES (?, ?, ?, ?)
+            """, (key, value, cost_ms, time.time()))
+            self._writes += 1
+            if self._writes % 100 == 0:
+                # Trim the disk store back to its bound, least recently used first
+                self.conn.execute(f"""
+                    DELETE FROM {self.table} WHERE key IN (
+                        SELECT key FROM {self.table} ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                    )
+                """, (self.disk_size,))
+            self.conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.conn.execute(f"DELETE FROM {self.table}")
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["memory_entries"] = len(self._memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups if lookups else 0.0
+        return stats
+
+
+# Semantic Answer Cache
+class AnswerCache:
+    """Returns stored answers for near-duplicate queries.
+
+    Entries are keyed on the normalized query embedding and scoped to a corpus
+    version and model name, so they go stale when documents or LLM_MODEL change.
+    """
+
+    def __init__(self, embeddings, path: str = ANSWER_CACHE_PATH,
+                 threshold: float = ANSWER_CACHE_THRESHOLD, max_entries: int = ANSWER_CACHE_SIZE):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.counters = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+        self._scope = None
+        self._ids: List[int] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS answer_cache (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                query TEXT,
+                embedding BLOB,
+                response TEXT,
+                reference_docs TEXT,
+                corpus_version TEXT,
+                model TEXT,
+                hits INTEGER DEFAULT 0,
+                last_used REAL
+            )
+        """)
+        self.conn.execute("""
+            CREATE INDEX IF NOT EXISTS idx_answer_cache_scope
+            ON answer_cache (corpus_version, model)
+        """)
+        self.conn.commit()
+
+    def embed(self, query: str) -> np.ndarray:
+        """Embed and L2-normalize a query so similarity is a dot product."""
+        vector = np.asarray(self.embeddings.embed_query(query.strip().lower()), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _load_scope(self, corpus_version: str, model: str):
+        """Load the in-memory index for a scope, dropping entries from older scopes.
+
+        Versions ending in "+<batches>" belong to an ingestion still in progress and
+        change with every stored batch, so older entries are only dropped once a
+        finished corpus version is seen.
+        """
+        scope = (corpus_version, model)
+        if self._scope == scope:
+            return
+        if "+" not in corpus_version:
+            self.conn.execute("""
+                DELETE FROM answer_cache WHERE corpus_version != ? OR model != ?
+            """, scope)
+            self.conn.commit()
+        rows = self.conn.execute("""
+            SELECT id, embedding FROM answer_cache WHERE corpus_version = ? AND model = ? ORDER BY id
+        """, scope).fetchall()
+        self._ids = [row[0] for row in rows]
+        vectors = [np.frombuffer(row[1], dtype=np.float32) for row in rows]
+        self._matrix = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        self._scope = scope
+
+    def lookup(self, vector: np.ndarray, corpus_version: str, model: str) -> Optional[Dict[str, Any]]:
+        """Return {"query", "response", "reference_docs", "similarity"} for the best match above the threshold."""
+        with self._lock:
+            self._load_scope(corpus_version, model)
+            if not self._ids:
+                self.counters["misses"] += 1
+                return None
+            scores = self._matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.counters["misses"] += 1
+                return None
+
+            entry_id = self._ids[best]
+            row = self.conn.execute("""
+                SELECT query, response, reference_docs FROM answer_cache WHERE id = ?
+            """, (entry_id,)).fetchone()
+            if row is None:
+                # Evicted by another process sharing the file: forget it and treat this as a miss
+                keep = [i for i in range(len(self._ids)) if i != best]
+                self._ids = [self._ids[i] for i in keep]
+                self._matrix = self._matrix[keep]
+                self.counters["misses"] += 1
+                return None
+            self.conn.execute("""
+                UPDATE answer_cache SET hits = hits + 1, last_used = ? WHERE id = ?
+            """, (time.time(), entry_id))
+            self.conn.commit()
+            self.counters["hits"] += 1
+
+        query, response, reference_docs_json = row
+        return {
+            "query": query,
+            "response": response,
+            "reference_docs": [
+                Document(page_content=doc["page_content"], metadata=doc["metadata"])
+                for doc in json.loads(reference_docs_json or "[]")
+            ],
+            "similarity": float(scores[best])
+        }
+
+    def store(self, query: str, vector: np.ndarray, response: str, reference_docs,
+              corpus_version: str, model: str):
+        """Store an answer, evicting the least recently used entries past max_entries."""
+        references = json.dumps([
+            {"page_content": doc.page_content, "metadata": doc.metadata}
+            for doc in (reference_docs or [])
+        ])
+        with self._lock:
+            self._load_scope(corpus_version, model)
+            cursor = self.conn.execute("""
+                INSERT INTO answer_cache (query, embedding, response, reference_docs, corpus_version, model, last_used)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, (query, vector.astype(np.float32).tobytes(), response, references,
+                  corpus_version, model, time.time()))
+            self._ids.append(cursor.lastrowid)
+            row = vector.astype(np.float32)[None, :]
+            self._matrix = np.vstack([self._matrix, row]) if self._matrix.size else row
+            self.counters["stores"] += 1
+
+            overflow = len(self._ids) - self.max_entries
+            if overflow > 0:
+                evicted = [r[0] for r in self.conn.execute("""
+                    SELECT id FROM answer_cache WHERE corpus_version = ? AND model = ?
+                    ORDER BY last_used ASC LIMIT ?
+                """, (corpus_version, model, overflow)).fetchall()]
+                self.conn.executemany("DELETE FROM answer_cache WHERE id = ?", [(i,) for i in evicted])
+                evicted_ids = set(evicted)
+                keep = [i for i, entry_id in enumerate(self._ids) if entry_id not in evicted_ids]
+                self._ids = [self._ids[i] for i in keep]
+                self._matrix = self._matrix[keep]
+                self.counters["evictions"] += len(evicted)
+            self.conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self.counters)
+            stats["entries"] = len(self._ids)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
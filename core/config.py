@@ -12,4 +12,101 @@ PROCESSED_FOLDER = "data/processed"
 LLM_API_KEY = os.getenv("LLM_API_KEY")
 LLM_MODEL = os.getenv("LLM_MODEL")
 HISTORY_CONTEXT = 5
-RETRIEVE_DOCS = 3
\ No newline at end of file
+RETRIEVE_DOCS = 3
+
+# Prompt context packing: token budget per model, estimated at CHARS_PER_TOKEN characters per token
+CONTEXT_TOKEN_BUDGETS = {
+    "llama3-8b-8192": 8192,
+    "llama3-70b-8192": 8192,
+    "gemma2-9b-it": 8192,
+    "mixtral-8x7b-32768": 32768,
+    "llama-3.1-8b-instant": 32768,
+    "llama-3.3-70b-versatile": 32768,
+}
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", CONTEXT_TOKEN_BUDGETS.get(LLM_MODEL, 8192)))
+RESPONSE_TOKEN_RESERVE = 1024   # Part of the budget left for the answer
+CHARS_PER_TOKEN = 4
+
+# Rolling conversation summaries: older turns are folded into a per-session summary in the background
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+RAW_HISTORY_TURNS = 2       # Most recent turns kept verbatim after summarizing
+SUMMARY_TRIGGER_TURNS = 4   # Unsummarized turns that trigger a summary update
+SUMMARY_MAX_WORDS = 250
+
+# Chat history database: pooled read connections and a batching background writer
+DB_READ_POOL_SIZE = 4
+DB_WRITE_BATCH = 256   # Maximum queued writes committed in one transaction
+ARCHIVE_DB_PATH = os.getenv("ARCHIVE_DB_PATH", os.path.splitext(DB_PATH)[0] + "_archive.db")
+HISTORY_RETENTION_DAYS = int(os.getenv("HISTORY_RETENTION_DAYS", 90))   # Idle sessions are archived after this; 0 keeps all
+HISTORY_MAINTENANCE_HOURS = float(os.getenv("HISTORY_MAINTENANCE_HOURS", 24))   # Archive and compact this often; 0 never
+SESSIONS_PAGE_SIZE = 50  # Sessions listed in the sidebar per page
+CHAT_SEARCH_RESULTS = 20  # Hits returned by a chat history search
+CHAT_SEARCH_SNIPPET_TOKENS = 12  # Words of context in each search snippet
+CHAT_SEARCH_CANDIDATES = 2000  # Newest messages with the less common words ranked per search
+CHAT_SEARCH_COMMON_SHARE = 0.1  # Words in a larger share of messages are matched but not scored
+
+# Per-node latency tracing of the chat workflow
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_DB_PATH = os.getenv("TRACE_DB_PATH", os.path.join(os.path.dirname(DB_PATH), "traces.db"))
+TRACE_WINDOW = 1000        # Recent spans per name used for the rolling percentiles
+TRACE_MAX_SPANS = 100000   # Older spans are deleted from the trace table
+METRICS_PANEL = os.getenv("METRICS_PANEL", "false").lower() == "true"   # Latency panel in the sidebar
+
+# Vector store backend: "chroma", or "mmap" for the in-process memory-mapped index (core/vectorstore.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+MMAP_INDEX_PATH = os.path.join(VECTOR_STORE_PATH, "mmap_index")
+MMAP_VECTOR_DTYPE = os.getenv("MMAP_VECTOR_DTYPE", "float16")   # "float16" or "int8"
+MMAP_IVF_LISTS = int(os.getenv("MMAP_IVF_LISTS", 0))   # Coarse index lists for large corpora; 0 searches exactly
+MMAP_IVF_PROBES = 8                                    # Lists scanned per query
+
+# Hybrid retrieval: BM25 lexical index fused with vector search by reciprocal rank fusion
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+LEXICAL_INDEX_PATH = os.path.join(VECTOR_STORE_PATH, "bm25.db")
+BM25_K1 = 1.5
+BM25_B = 0.75
+RRF_K = 60           # Rank constant for reciprocal rank fusion
+FUSION_CANDIDATES = 4  # Each retriever returns k * FUSION_CANDIDATES candidates before fusion
+
+# Query embedding and retrieval result caches (in-memory LRU backed by SQLite)
+QUERY_CACHE_ENABLED = os.getenv("QUERY_CACHE_ENABLED", "true").lower() == "true"
+QUERY_CACHE_PATH = os.path.join(VECTOR_STORE_PATH, "query_cache.db")
+QUERY_CACHE_MEMORY_SIZE = 1024     # Entries per cache level held in memory
+QUERY_CACHE_DISK_SIZE = 100000     # Entries per cache level kept on disk
+
+# Document ingestion
+INGEST_ON_STARTUP = os.getenv("INGEST_ON_STARTUP", "true").lower() == "true"
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", min(4, os.cpu_count() or 1)))   # PDF parser processes
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 64))   # Chunks per embedding call / vector store write
+INGEST_QUEUE_PAGES = int(os.getenv("INGEST_QUEUE_PAGES", 32))   # Parsed pages buffered ahead of embedding; bounds ingestion memory
+INGEST_START_METHOD = os.getenv("INGEST_START_METHOD", "forkserver")   # How parser processes start; fork can deadlock in the threaded app
+INGEST_RECORD_EVERY_FILES = 50   # Files ingested between saves of processed_files.json...
+INGEST_RECORD_EVERY_SECONDS = 30   # ...or seconds, whichever comes first; it is also saved when a run ends
+CHUNK_SIZE = 1500
+CHUNK_OVERLAP = 300
+
+# Background corpus watcher: new, changed and removed PDFs are ingested while the app runs
+CORPUS_WATCH = os.getenv("CORPUS_WATCH", "true").lower() == "true"
+CORPUS_WATCH_INTERVAL = 10   # Seconds between scans of PROCESSED_FOLDER
+
+# Resources loaded in a background thread when the app starts
+WARMUP_RESOURCES = ["embeddings", "retriever", "llm"] + (["watcher"] if CORPUS_WATCH else [])
+
+# Retrieval routing: "local" (lexical + embedding), "lexical", "embedding" or "llm"
+ROUTER_MODE = os.getenv("ROUTER_MODE", "local")
+ROUTER_CONFIDENCE = 0.6   # Below this the router falls back to the LLM
+
+# Speculative execution: retrieval and history loading run in parallel with the routing decision
+SPECULATIVE_EXECUTION = os.getenv("SPECULATIVE_EXECUTION", "true").lower() == "true"
+SPECULATIVE_WORKERS = 4
+
+# Semantic answer cache, stored next to the chat history database
+ANSWER_CACHE_ENABLED = os.getenv("ANSWER_CACHE_ENABLED", "true").lower() == "true"
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", os.path.join(os.path.dirname(DB_PATH), "answer_cache.db"))
+ANSWER_CACHE_THRESHOLD = 0.9   # Minimum cosine similarity for a cached answer to be reused
+ANSWER_CACHE_SIZE = 1000       # Maximum cached answers before least recently used are evicted
+
+# Batch question answering (python -m core.batch); the LLM limits default to Groq's free tier
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))               # Questions in flight
+BATCH_MAX_RETRIES = 5                                                    # Retries per question, with exponential backoff
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", 30))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", 6000))   # Prompt plus RESPONSE_TOKEN_RESERVE per call
@@ -0,0 +1,112 @@
+import math
+from typing import Any, Dict, List, Tuple
+
+from langchain_core.documents import Document
+
+from .config import CHARS_PER_TOKEN, CHUNK_OVERLAP, CONTEXT_TOKEN_BUDGET, RESPONSE_TOKEN_RESERVE
+
+MIN_OVERLAP = 20   # Shorter shared text between chunks is treated as coincidence
+MIN_SECTION_TOKENS = 64  # A context section is only cut down if at least this much of it fits
+
+
+def count_tokens(text: str) -> int:
+    """Approximate token count; fast enough to run on every prompt."""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def _overlap(left: str, right: str, max_overlap: int) -> int:
+    """Length of the longest suffix of left that is also a prefix of right."""
+    if len(right) < MIN_OVERLAP:
+        return 0
+    probe = right[:MIN_OVERLAP]
+    start = max(0, len(left) - max_overlap)
+    position = left.find(probe, start)
+    while position != -1:
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position = left.find(probe, position + 1)
+    return 0
+
+
+def merge_chunks(docs: List[Document], max_overlap: int = CHUNK_OVERLAP * 2) -> List[Document]:
+    """Merge chunks from the same source and page, dropping the text they share.
+
+    The splitter repeats up to CHUNK_OVERLAP characters between neighbouring
+    chunks. Sections keep the rank of their best chunk.
+    """
+    sections: Dict[Tuple[Any, Any], List[str]] = {}
+    metadatas: Dict[Tuple[Any, Any], Dict] = {}
+    for doc in docs:
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        texts = sections.setdefault(key, [])
+        metadatas.setdefault(key, doc.metadata)
+        text = doc.page_content
+        if any(text in existing for existing in texts):
+            continue
+        for i, existing in enumerate(texts):
+            shared = _overlap(existing, text, max_overlap)
+            if shared:
+                texts[i] = existing + text[shared:]
+                break
+            shared = _overlap(text, existing, max_overlap)
+            if shared:
+                texts[i] = text + existing[shared:]
+                break
+        else:
+            texts.append(text)
+    return [
+        Document(page_content="\n...\n".join(texts), metadata=metadatas[key])
+        for key, texts in sections.items()
+    ]
+
+
+def _format_turn(turn: Dict) -> str:
+    return f"User: {turn['user_message']}\nBot: {turn['response']}"
+
+
+# Prompt Context Packing
+class ContextPacker:
+    """Fits retrieved context and conversation history into a token budget.
+
+    The latest turn is kept first for continuity, then retrieved sections in
+    rank order, then older turns from newest to oldest while budget remains.
+    """
+
+    def __init__(self, budget: int = CONTEXT_TOKEN_BUDGET, response_reserve: int = RESPONSE_TOKEN_RESERVE):
+        self.budget = budget
+        self.response_reserve = response_reserve
+
+    def pack(self, docs: List[Document], history: List[Dict], fixed_tokens: int = 0,
+             summary: str = "") -> Tuple[str, str]:
+        """Return (context, history) strings for the prompt.
+
+        history is newest first, as returned by the database; it is rendered oldest first.
+        fixed_tokens covers the system prompt and query, which are never trimmed; a
+        conversation summary is bounded in length and always kept ahead of the turns.
+        """
+        summary = f"Summary of the earlier conversation:\n{summary}\n" if summary else ""
+        remaining = self.budget - self.response_reserve - fixed_tokens - count_tokens(summary)
+        turns = [_format_turn(turn) for turn in history]
+        kept_turns = []
+        if turns and count_tokens(turns[0]) <= remaining:
+            kept_turns.append(turns[0])
+            remaining -= count_tokens(turns[0])
+
+        sections = []
+        for section in merge_chunks(docs):
+            tokens = count_tokens(section.page_content)
+            if tokens <= remaining:
+                sections.append(section.page_content)
+                remaining -= tokens
+            elif remaining >= MIN_SECTION_TOKENS:
+                sections.append(section.page_content[:remaining * CHARS_PER_TOKEN])
+                remaining = 0
+
+        for turn in turns[1:]:
+            tokens = count_tokens(turn)
+            if tokens > remaining:
+                break
+            kept_turns.append(turn)
+            remaining -= tokens
+
+        return "\n\n".join(sections), summary + "\n".join(reversed(kept_turns))
@@ -1,97 +1,1042 @@
 # Database Layer
-import sqlite3
-from typing import List
-from .config import DB_PATH, HISTORY_CONTEXT
+import os
+import re
+import sys
+import asyncio
 import json
+import time
+import zlib
+import queue
+import atexit
+import hashlib
+import itertools
+import argparse
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+from .config import DB_PATH, HISTORY_CONTEXT, DB_READ_POOL_SIZE, DB_WRITE_BATCH, CHAT_SEARCH_RESULTS, \
+    CHAT_SEARCH_SNIPPET_TOKENS, CHAT_SEARCH_CANDIDATES, CHAT_SEARCH_COMMON_SHARE, ARCHIVE_DB_PATH, \
+    HISTORY_RETENTION_DAYS, HISTORY_MAINTENANCE_HOURS
+
+try:
+    import zstandard
+except ImportError:  # Installed with langchain (through langsmith); archives fall back to zlib without it
+    zstandard = None
+
+ARCHIVE_ZSTD_LEVEL = 10
+ARCHIVE_BATCH_SESSIONS = 50   # Sessions moved per transaction, so queued chat writes never wait long
+ANALYZE_ROW_LIMIT = 1000      # Rows sampled per index by ANALYZE
+FTS_MERGE_PAGES = 500         # Full-text index pages merged per step
+FTS_FULL_MERGE_SHARE = 0.1    # Merge the whole index once a run has archived this share of the messages
+
+
+def reference_hash(page_content: str, metadata: dict) -> str:
+    """Content address of a reference chunk."""
+    payload = json.dumps({"page_content": page_content, "metadata": metadata}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _store_references(conn: sqlite3.Connection, references: List[Dict]) -> List[str]:
+    hashes = []
+    for reference in references:
+        digest = reference_hash(reference["page_content"], reference["metadata"])
+        conn.execute("""
+            INSERT OR IGNORE INTO chunks (hash, page_content, metadata) VALUES (?, ?, ?)
+        """, (digest, reference["page_content"], json.dumps(reference["metadata"])))
+        hashes.append(digest)
+    return hashes
+
+
+def _move_references_to_chunks(conn: sqlite3.Connection, batch_size: int = 500):
+    """Replace the JSON reference blobs of existing rows with chunk hashes."""
+    last_id = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, reference_docs FROM chats
+            WHERE id > ? AND reference_docs IS NOT NULL AND reference_ids IS NULL
+            ORDER BY id LIMIT ?
+        """, (last_id, batch_size)).fetchall()
+        if not rows:
+            break
+        for chat_id, reference_docs_json in rows:
+            hashes = _store_references(conn, json.loads(reference_docs_json or "[]"))
+            conn.execute("""
+                UPDATE chats SET reference_ids = ?, reference_docs = NULL WHERE id = ?
+            """, (json.dumps(hashes), chat_id))
+        last_id = rows[-1][0]
+
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version.
+# Entries are SQL statements or callables taking the connection.
+MIGRATIONS = [
+    # 1: base tables
+    [
+        """
+        CREATE TABLE IF NOT EXISTS chats (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            user_message TEXT,
+            response TEXT,
+            reference_docs TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT,
+            name TEXT,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        """,
+    ],
+    # 2: history lookups seek by session and read newest first; sessions are looked up by ID
+    [
+        "CREATE INDEX IF NOT EXISTS idx_chats_session_timestamp ON chats (session_id, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS idx_sessions_session_id ON sessions (session_id, name, created_at)",
+    ],
+    # 3: references are stored once in a content-addressed chunks table and referenced by hash
+    [
+        """
+        CREATE TABLE IF NOT EXISTS chunks (
+            hash TEXT PRIMARY KEY,
+            page_content TEXT,
+            metadata TEXT
+        ) WITHOUT ROWID
+        """,
+        "ALTER TABLE chats ADD COLUMN reference_ids TEXT",
+        _move_references_to_chunks,
+    ],
+    # 4: estimated prompt size of each turn
+    [
+        "ALTER TABLE chats ADD COLUMN prompt_tokens INTEGER",
+    ],
+    # 5: rolling conversation summary, covering chats up to summarized_until
+    [
+        "ALTER TABLE sessions ADD COLUMN summary TEXT",
+        "ALTER TABLE sessions ADD COLUMN summarized_until INTEGER DEFAULT 0",
+    ],
+    # 6: trace of the turn that produced each message
+    [
+        "ALTER TABLE chats ADD COLUMN trace_id TEXT",
+    ],
+    # 7: full-text index over messages; triggers keep it in step with every write to chats,
+    # and existing rows are indexed by the rebuild
+    [
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS chats_fts USING fts5(
+            user_message, response, content='chats', content_rowid='id', tokenize='porter unicode61'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS chats_fts_insert AFTER INSERT ON chats BEGIN
+            INSERT INTO chats_fts (rowid, user_message, response) VALUES (new.id, new.user_message, new.response);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS chats_fts_delete AFTER DELETE ON chats BEGIN
+            INSERT INTO chats_fts (chats_fts, rowid, user_message, response)
+            VALUES ('delete', old.id, old.user_message, old.response);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS chats_fts_update AFTER UPDATE OF user_message, response ON chats BEGIN
+            INSERT INTO chats_fts (chats_fts, rowid, user_message, response)
+            VALUES ('delete', old.id, old.user_message, old.response);
+            INSERT INTO chats_fts (rowid, user_message, response) VALUES (new.id, new.user_message, new.response);
+        END
+        """,
+        "INSERT INTO chats_fts (chats_fts) VALUES ('rebuild')",
+        "INSERT INTO chats_fts (chats_fts) VALUES ('optimize')",
+    ],
+    # 8: log of maintenance runs; the newest one decides when the next is due
+    [
+        """
+        CREATE TABLE IF NOT EXISTS maintenance_runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            ran_at DATETIME,
+            report TEXT
+        )
+        """,
+    ],
+    # 9: one row per session, so summaries can be upserted; of duplicate rows the one with
+    # the furthest summary is kept
+    [
+        """
+        DELETE FROM sessions WHERE id NOT IN (
+            SELECT (SELECT s2.id FROM sessions s2 WHERE s2.session_id IS s.session_id
+                    ORDER BY COALESCE(s2.summarized_until, 0) DESC, s2.id LIMIT 1)
+            FROM sessions s GROUP BY s.session_id
+        )
+        """,
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_sessions_unique_id ON sessions (session_id)",
+    ],
+    # 10: the session list pages through sessions newest first
+    [
+        "CREATE INDEX IF NOT EXISTS idx_sessions_created ON sessions (created_at DESC, session_id)",
+    ],
+]
+
+# Sessions moved out of the hot database. Each payload holds the session's rows from
+# sessions, chats and chunks as compressed JSON, so a restore puts them back unchanged.
+ARCHIVE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archived_sessions (
+        session_id TEXT PRIMARY KEY,
+        name TEXT,
+        created_at DATETIME,
+        last_activity DATETIME,
+        message_count INTEGER,
+        archived_at DATETIME,
+        codec TEXT,
+        payload BLOB
+    );
+    CREATE INDEX IF NOT EXISTS idx_archived_sessions_created ON archived_sessions (created_at DESC, session_id);
+"""
+
+
+def _compress(data: bytes) -> Tuple[str, bytes]:
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=ARCHIVE_ZSTD_LEVEL).compress(data)
+    return "zlib", zlib.compress(data, 9)
+
+
+def _decompress(codec: str, payload: bytes) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(payload)
+    return zlib.decompress(payload)
+
+
+def _select(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[Dict]:
+    """Rows as column -> value dicts."""
+    cursor = conn.execute(sql, params)
+    columns = [column[0] for column in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor]
+
+
+# Words found in most messages: they barely change the ranking, but scoring them means
+# reading their whole posting list
+SEARCH_STOP_WORDS = frozenset("""
+    a about an and are as at be by can do does for from how i if in is it me my of on or so that the this to
+    under was what when where which who why will with you your
+""".split())
+SEARCH_DENSITY_SAMPLE = 1000  # Newest matches of a word used to estimate how common it is
+SEARCH_CHECK_FACTOR = 4  # Best candidates checked for the common words, per result wanted
+
+
+def search_words(text: str) -> List[str]:
+    """Lower-cased words of free text, without stop words unless nothing else is left."""
+    words = re.findall(r"\w+", text.lower())
+    return [word for word in words if word not in SEARCH_STOP_WORDS] or words
+
+
+def fts_query(words: List[str]) -> str:
+    """FTS5 query matching messages that contain every word, quoted so that punctuation
+    and operators typed by the user are taken literally."""
+    return " ".join(f'"{word}"' for word in words)
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA busy_timeout = 30000")
+    # WAL lets readers proceed while the writer commits; NORMAL sync is durable enough with WAL
+    conn.execute("PRAGMA synchronous = NORMAL")
+    return conn
+
+
+def _now() -> str:
+    """UTC timestamp in the same format as SQLite's CURRENT_TIMESTAMP."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+class ConnectionPool:
+    """Fixed-size pool of read-only connections shared across threads."""
+
+    def __init__(self, path: str, size: int, attach: Dict[str, str] = None):
+        self._connections = queue.Queue()
+        for _ in range(size):
+            conn = _connect(path)
+            for name, attached_path in (attach or {}).items():
+                conn.execute(f"ATTACH DATABASE ? AS {name}", (attached_path,))
+            conn.execute("PRAGMA query_only = ON")
+            self._connections.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._connections.get()
+        try:
+            yield conn
+        finally:
+            self._connections.put(conn)
+
+
+class WriteBehindQueue:
+    """Background thread that applies queued writes in batched transactions.
+
+    Every write gets a sequence number; wait() blocks until a given write is
+    committed and raises the error it failed with, if any.
+    """
+
+    MAX_FAILURES = 1000  # Failures kept for callers that have not waited on them yet
+
+    def __init__(self, path: str, batch_size: int):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._conn = _connect(path)
+        self._submitted = 0
+        self._submit_lock = threading.Lock()
+        self._applied = 0
+        self._failures = {}
+        self._applied_changed = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="chat-db-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, sql: str, params: tuple) -> int:
+        """Queue a write and return its sequence number."""
+        # Numbers are handed out in queue order, so applied writes always form a prefix
+        with self._submit_lock:
+            self._submitted += 1
+            self._queue.put((self._submitted, sql, params))
+            return self._submitted
+
+    @property
+    def applied(self) -> int:
+        """Sequence number of the last write that has been committed (or has failed)."""
+        return self._applied
+
+    def wait(self, sequence: int):
+        """Block until write number `sequence` is committed; raise its error if it failed."""
+        with self._applied_changed:
+            self._applied_changed.wait_for(lambda: self._applied >= sequence)
+            error = self._failures.pop(sequence, None)
+        if error is not None:
+            raise error
+
+    def flush(self):
+        """Block until every write queued so far has been committed."""
+        sequence = self._submitted
+        with self._applied_changed:
+            self._applied_changed.wait_for(lambda: self._applied >= sequence)
+
+    def _apply(self, ops):
+        with self._conn:
+            for _, sql, params in ops:
+                self._conn.execute(sql, params)
+
+    def _run(self):
+        while True:
+            ops = [self._queue.get()]
+            # Take whatever else is already waiting, so bursts share one commit
+            while len(ops) < self.batch_size:
+                try:
+                    ops.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            failures = {}
+            try:
+                self._apply(ops)
+            except sqlite3.Error:
+                # Retry one by one so a single bad write does not drop the rest of the batch
+                for op in ops:
+                    try:
+                        self._apply([op])
+                    except sqlite3.Error as e:
+                        print(f"Chat history write failed: {e}")
+                        failures[op[0]] = e
+            finally:
+                with self._applied_changed:
+                    self._failures.update(failures)
+                    while len(self._failures) > self.MAX_FAILURES:
+                        del self._failures[next(iter(self._failures))]
+                    self._applied = ops[-1][0]
+                    self._applied_changed.notify_all()
+
+
+MAX_TRACKED_SESSION_WRITES = 10000  # Sessions with a pending write before committed ones are forgotten
+
 
 class ChatDatabase:
-    def __init__(self):
-        self.conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-        self._create_table()
-
-    def _create_table(self):
-        # print("Creating tables >>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>>")
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS chats (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT,
-                user_message TEXT,
-                response TEXT,
-                reference_docs TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        self.conn.execute("""
-            CREATE TABLE IF NOT EXISTS sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                session_id TEXT,
-                name TEXT,
-                created_at DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        self.conn.commit()
-
-    def save_chat(self, session_id: str, user_message: str, response: str, reference_docs=None):
-        """Save a chat message with references stored as JSON"""
-        cursor = self.conn.cursor()
-        
-        # Convert list of Documents to list of dictionaries
-        references = json.dumps([
+    def __init__(self, path: str = DB_PATH, archive_path: str = None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        # By default the archive is named after the database file
+        self.archive_path = archive_path or (ARCHIVE_DB_PATH if path == DB_PATH else
+                                             os.path.splitext(path)[0] + "_archive.db")
+        self._migrate()
+        self._pool = ConnectionPool(path, DB_READ_POOL_SIZE, attach={"archive": self.archive_path})
+        self._writer = WriteBehindQueue(path, DB_WRITE_BATCH)
+        atexit.register(self._writer.flush)
+        # Bumped on every write, so callers can tell when cached reads are stale
+        self._versions = itertools.count(1)
+        self.version = 0
+        # Last write queued by the current thread or task, and by each session with pending writes,
+        # so reads wait for the writes they depend on rather than for the whole queue
+        self._caller_write = contextvars.ContextVar(f"chat_db_write_{id(self)}", default=0)
+        self._session_writes = {}
+        self._session_writes_lock = threading.Lock()
+        # Archiving and restoring move rows between two files; one at a time per process
+        self._maintenance_lock = threading.Lock()
+        self._maintenance_thread = None
+
+    def _migrate(self):
+        """Bring an existing or new database file up to the current schema."""
+        conn = _connect(self.path)
+        try:
+            # Takes effect on a new file; existing files are converted by the VACUUM below
+            conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.execute("PRAGMA journal_mode = WAL")
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            # The sqlite3 module commits before DDL on its own, so each migration runs in an
+            # explicit transaction together with its user_version bump: it applies fully or not at all
+            conn.isolation_level = None
+            while True:
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    # Read again under the write lock, in case another process migrated meanwhile
+                    current = conn.execute("PRAGMA user_version").fetchone()[0]
+                    if current >= len(MIGRATIONS):
+                        conn.execute("COMMIT")
+                        break
+                    for statement in MIGRATIONS[current]:
+                        if callable(statement):
+                            statement(conn)
+                        else:
+                            conn.execute(statement)
+                    conn.execute(f"PRAGMA user_version = {current + 1}")
+                    conn.execute("COMMIT")
+                except BaseException:
+                    conn.execute("ROLLBACK")
+                    raise
+            # Reference blobs moved out of chats: give the freed pages back to the filesystem.
+            # Incremental auto-vacuum lets maintain() do the same later without rewriting the file.
+            if version < 3 <= len(MIGRATIONS) or conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+                conn.execute("VACUUM")
+        finally:
+            conn.close()
+
+        archive = _connect(self.archive_path)
+        try:
+            archive.execute("PRAGMA journal_mode = WAL")
+            archive.executescript(ARCHIVE_SCHEMA)
+        finally:
+            archive.close()
+
+    @contextmanager
+    def _read(self, session_id: str = None):
+        # Read-your-writes: the caller's own pending writes, and those of the session being
+        # read, are committed first. A failure of the write waited on is raised here.
+        sequence = max(self._caller_write.get(), self._session_writes.get(session_id, 0))
+        if sequence > self._writer.applied:
+            self._writer.wait(sequence)
+        with self._pool.connection() as conn:
+            yield conn
+
+    def flush(self):
+        """Wait for queued writes to reach the database."""
+        self._writer.flush()
+
+    def _submit(self, sql: str, params: tuple, session_id: str = None) -> int:
+        sequence = self._writer.submit(sql, params)
+        self._caller_write.set(sequence)
+        if session_id is not None:
+            with self._session_writes_lock:
+                if len(self._session_writes) >= MAX_TRACKED_SESSION_WRITES:
+                    applied = self._writer.applied
+                    self._session_writes = {sid: seq for sid, seq in self._session_writes.items() if seq > applied}
+                self._session_writes[session_id] = sequence
+        self.version = next(self._versions)
+        return sequence
+
+    def save_chat(self, session_id: str, user_message: str, response: str, reference_docs=None,
+                  prompt_tokens: int = None, trace_id: str = None):
+        """Queue a chat message; returns without waiting for the write.
+
+        Reference chunks are stored once in the chunks table and the chat row
+        keeps only their content hashes. The insert also indexes the message
+        for search (see the chats_fts triggers).
+        """
+        references = [
             {"page_content": doc.page_content, "metadata": doc.metadata}
             for doc in (reference_docs or [])
-        ])
-        
-        cursor.execute("""
-            INSERT INTO chats (session_id, user_message, response, reference_docs)
-            VALUES (?, ?, ?, ?)
-        """, (session_id, user_message, response, references))
-        
-        self.conn.commit()
+        ]
+        for reference in references:
+            self._submit("""
+                INSERT OR IGNORE INTO chunks (hash, page_content, metadata) VALUES (?, ?, ?)
+            """, (reference_hash(reference["page_content"], reference["metadata"]),
+                  reference["page_content"], json.dumps(reference["metadata"])))
+        reference_ids = json.dumps([reference_hash(r["page_content"], r["metadata"]) for r in references])
+
+        self._submit("""
+            INSERT INTO chats (session_id, user_message, response, reference_ids, prompt_tokens, trace_id, timestamp)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """, (session_id, user_message, response, reference_ids, prompt_tokens, trace_id, _now()), session_id)
+
     def create_session(self, session_id: str, metadata: dict):
-        """Create a new session with metadata"""
-        # Add this method to save session metadata (name, created_at) to your database
-        # Implementation depends on your database structure
-        cursor = self.conn.cursor()
-        cursor.execute("""
+        """Create a new session with metadata; created_at is UTC, formatted like CURRENT_TIMESTAMP"""
+        # The row may already exist if a summary was saved for the session first
+        self._submit("""
             INSERT INTO sessions (session_id, name, created_at)
             VALUES (?, ?, ?)
-        """, (session_id, metadata['name'], metadata['created_at']))
-        self.conn.commit()
+            ON CONFLICT (session_id) DO UPDATE SET name = excluded.name, created_at = excluded.created_at
+        """, (session_id, metadata['name'], metadata['created_at']), session_id)
 
     def get_all_sessions(self):
         """Retrieve all sessions with their metadata"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT session_id, name, created_at
-            FROM sessions
-        """)
+        with self._read() as conn:
+            rows = conn.execute("""
+                SELECT session_id, name, created_at
+                FROM sessions
+            """).fetchall()
         sessions = {}
-        for row in cursor.fetchall():
+        for row in rows:
             sessions[row[0]] = {
                 'name': row[1],
                 'created_at': row[2]
             }
         return sessions
 
-    def get_chat_history(self, session_id: str, limit=HISTORY_CONTEXT):
-        """Retrieve chat history for a session with reference docs as list of dicts"""
-        cursor = self.conn.cursor()
-        cursor.execute("""
-            SELECT user_message, response, reference_docs
-            FROM chats
-            WHERE session_id = ?
-            ORDER BY timestamp DESC LIMIT ?
-        """, (session_id, limit))
-        
-        history = []
-        for row in cursor.fetchall():
-            user_message, response, reference_docs_json = row
-            reference_docs = json.loads(reference_docs_json) if reference_docs_json else []
-            
-            history.append({
-                'user_message': user_message,
-                'response': response,
-                'reference_docs': reference_docs
-            })
-        
-        return history
\ No newline at end of file
+    def get_summary(self, session_id: str) -> Dict:
+        """Rolling summary of a session and the last chat ID it covers."""
+        with self._read(session_id) as conn:
+            row = conn.execute("""
+                SELECT summary, summarized_until FROM sessions WHERE session_id = ?
+            """, (session_id,)).fetchone()
+        return {'summary': (row[0] if row else None) or "", 'summarized_until': (row[1] if row else None) or 0}
+
+    def update_summary(self, session_id: str, summary: str, summarized_until: int):
+        """Queue a new rolling summary for a session.
+
+        Sessions that were never created (API and batch sessions) get a row named
+        after their ID, so the summary is kept rather than recomputed every turn.
+        """
+        self._submit("""
+            INSERT INTO sessions (session_id, name, created_at, summary, summarized_until)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (session_id) DO UPDATE
+            SET summary = excluded.summary, summarized_until = excluded.summarized_until
+        """, (session_id, session_id, _now(), summary, summarized_until), session_id)
+
+    def get_session_summaries(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        """One page of sessions, newest first, with last activity and message count.
+
+        Archived sessions are listed too (archived=True); they are restored when
+        opened. Messages themselves are not loaded; use get_chat_history when a
+        session is opened.
+        """
+        # The page is picked from the created_at indexes first; messages are only
+        # counted for the sessions on it. Archived sessions carry their own counts.
+        with self._read() as conn:
+            rows = conn.execute("""
+                WITH page AS (
+                    SELECT * FROM (
+                        SELECT * FROM (
+                            SELECT session_id, name, created_at, NULL AS last_activity,
+                                   NULL AS message_count, 0 AS archived
+                            FROM sessions ORDER BY created_at DESC, session_id LIMIT :end
+                        )
+                        UNION ALL
+                        SELECT * FROM (
+                            SELECT session_id, name, created_at, last_activity, message_count, 1
+                            FROM archive.archived_sessions
+                            WHERE session_id NOT IN (SELECT session_id FROM sessions)
+                            ORDER BY created_at DESC, session_id LIMIT :end
+                        )
+                    )
+                    ORDER BY created_at DESC, session_id LIMIT :limit OFFSET :offset
+                )
+                SELECT p.session_id, p.name, p.created_at,
+                       CASE WHEN p.archived THEN p.last_activity ELSE COALESCE(
+                           (SELECT MAX(c.timestamp) FROM chats c WHERE c.session_id = p.session_id), p.created_at)
+                       END,
+                       CASE WHEN p.archived THEN p.message_count ELSE
+                           (SELECT COUNT(*) FROM chats c WHERE c.session_id = p.session_id)
+                       END,
+                       p.archived
+                FROM page p
+                ORDER BY p.created_at DESC, p.session_id
+            """, {"limit": limit, "offset": offset, "end": limit + offset}).fetchall()
+        return [
+            {
+                'session_id': session_id,
+                'name': name,
+                'created_at': created_at,
+                'last_activity': last_activity,
+                'message_count': message_count,
+                'archived': bool(archived)
+            }
+            for session_id, name, created_at, last_activity, message_count, archived in rows
+        ]
+
+    def _load_references(self, conn: sqlite3.Connection, hashes: List[str]) -> List[Dict]:
+        if not hashes:
+            return []
+        placeholders = ",".join("?" * len(hashes))
+        rows = conn.execute(f"""
+            SELECT hash, page_content, metadata FROM chunks WHERE hash IN ({placeholders})
+        """, hashes).fetchall()
+        chunks = {row[0]: {"page_content": row[1], "metadata": json.loads(row[2])} for row in rows}
+        return [chunks[h] for h in hashes if h in chunks]
+
+    def get_references(self, chat_id: int) -> List[Dict]:
+        """Reference docs of one chat message as a list of dicts, for the "View References" panel."""
+        with self._read() as conn:
+            row = conn.execute("SELECT reference_ids FROM chats WHERE id = ?", (chat_id,)).fetchone()
+            return self._load_references(conn, json.loads(row[0] or "[]")) if row else []
+
+    def get_chat_history(self, session_id: str, limit=HISTORY_CONTEXT, include_references: bool = False,
+                         after_id: int = 0):
+        """Retrieve chat history for a session, newest first.
+
+        Each message carries its chat_id and reference_ids; the reference text is
+        only loaded when include_references is set (or later via get_references).
+        after_id skips messages already folded into the session summary. An
+        archived session is restored first.
+        """
+        with self._read(session_id) as conn:
+            archived = conn.execute("""
+                SELECT 1 FROM archive.archived_sessions WHERE session_id = ?
+            """, (session_id,)).fetchone()
+            rows = [] if archived else conn.execute("""
+                SELECT id, user_message, response, reference_ids
+                FROM chats
+                WHERE session_id = ? AND id > ?
+                ORDER BY timestamp DESC, id DESC LIMIT ?
+            """, (session_id, after_id, limit)).fetchall()
+
+            history = []
+            for chat_id, user_message, response, reference_ids_json in rows:
+                message = {
+                    'chat_id': chat_id,
+                    'user_message': user_message,
+                    'response': response,
+                    'reference_ids': json.loads(reference_ids_json or "[]")
+                }
+                if include_references:
+                    message['reference_docs'] = self._load_references(conn, message['reference_ids'])
+                history.append(message)
+
+        if archived and self.restore_session(session_id):
+            return self.get_chat_history(session_id, limit, include_references, after_id)
+        return history
+
+    def _common_words(self, conn: sqlite3.Connection, words: List[str]) -> set:
+        """Words with long posting lists that occur in more than CHAT_SEARCH_COMMON_SHARE of recent messages.
+
+        The share is estimated from how many rows the newest SEARCH_DENSITY_SAMPLE
+        matches of a word span, which takes about a millisecond where counting its
+        matches would read its whole posting list. Words with fewer matches than
+        that are cheap to score and never count as common.
+        """
+        newest = conn.execute("SELECT MAX(id) FROM chats").fetchone()[0]
+        common = set()
+        for word in words:
+            rows = conn.execute("""
+                SELECT rowid FROM chats_fts WHERE chats_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+            """, (fts_query([word]), SEARCH_DENSITY_SAMPLE)).fetchall()
+            if len(rows) == SEARCH_DENSITY_SAMPLE and \
+                    SEARCH_DENSITY_SAMPLE / (newest - rows[-1][0] + 1) > CHAT_SEARCH_COMMON_SHARE:
+                common.add(word)
+        return common
+
+    def _containing_all(self, conn: sqlite3.Connection, words: List[str], common: List[str],
+                        ranked: List[int], limit: int) -> List[int]:
+        """The messages of ranked, in order, that also contain the common words.
+
+        Usually only the best few need checking. Checking a message costs a seek in
+        the posting list of each word, so only the common words are looked up there.
+        """
+        best = ranked[:SEARCH_CHECK_FACTOR * limit]
+        placeholders = ",".join("?" * len(best))
+        matched = {row[0] for row in conn.execute(f"""
+            SELECT rowid FROM chats_fts WHERE chats_fts MATCH ? AND rowid IN ({placeholders})
+        """, (fts_query(common), *best))}
+        if len(best) < len(ranked) and sum(chat_id in matched for chat_id in best) < limit:
+            # Few of the best have the common words too: match every word over the candidate range instead
+            matched = {row[0] for row in conn.execute("""
+                SELECT rowid FROM chats_fts WHERE chats_fts MATCH ? AND rowid >= ?
+            """, (fts_query(words), min(ranked)))}
+        return [chat_id for chat_id in ranked if chat_id in matched]
+
+    def search(self, query: str, limit: int = CHAT_SEARCH_RESULTS) -> List[Dict]:
+        """Messages containing every word of the query, best match first.
+
+        Words are matched on their stems, so "limitation periods" also finds
+        "period of limitation". The newest CHAT_SEARCH_CANDIDATES messages with
+        the query's less common words are ranked with BM25 over those words, and
+        the common ones are then checked on the best candidates only: BM25 gives
+        words in most messages almost no weight, and FTS5 would read their whole
+        posting lists to score or intersect them. Each hit carries its session
+        and a snippet with the matched words in bold.
+        """
+        words = search_words(query)
+        if not words:
+            return []
+        match = fts_query(words)
+        with self._read() as conn:
+            common = self._common_words(conn, words)
+            scored = [word for word in words if word not in common]
+            common = [word for word in words if word in common]
+            if scored:
+                candidates = conn.execute("""
+                    SELECT rowid, bm25(chats_fts) FROM chats_fts WHERE chats_fts MATCH ?
+                    ORDER BY rowid DESC LIMIT ?
+                """, (fts_query(scored), CHAT_SEARCH_CANDIDATES)).fetchall()
+                ranked = [chat_id for chat_id, _ in sorted(candidates, key=lambda c: (c[1], -c[0]))]
+                if common and ranked:
+                    ranked = self._containing_all(conn, words, common, ranked, limit)
+            else:
+                # Only common words: BM25 barely tells the matches apart, so the newest come first
+                ranked = [row[0] for row in conn.execute("""
+                    SELECT rowid FROM chats_fts WHERE chats_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+                """, (match, limit))]
+            ranked = ranked[:limit]
+            if not ranked:
+                return []
+
+            placeholders = ",".join("?" * len(ranked))
+            rows = conn.execute(f"""
+                SELECT c.id, c.session_id, s.name, s.created_at, c.timestamp
+                FROM chats c LEFT JOIN sessions s ON s.session_id = c.session_id
+                WHERE c.id IN ({placeholders})
+            """, ranked).fetchall()
+            snippets = dict(conn.execute(f"""
+                SELECT rowid, snippet(chats_fts, -1, '**', '**', '…', ?) FROM chats_fts
+                WHERE chats_fts MATCH ? AND rowid IN ({placeholders})
+            """, (CHAT_SEARCH_SNIPPET_TOKENS, match, *ranked)).fetchall())
+        found = {row[0]: row for row in rows}
+        return [
+            {
+                'chat_id': chat_id,
+                'session_id': session_id,
+                'session_name': name,
+                'session_created_at': created_at,
+                'timestamp': timestamp,
+                'snippet': snippets.get(chat_id, "")
+            }
+            for chat_id, session_id, name, created_at, timestamp in (found[i] for i in ranked if i in found)
+        ]
+
+    def _idle_sessions(self, conn: sqlite3.Connection, cutoff: str) -> List[str]:
+        """Sessions whose last message (or creation, if they have none) is older than cutoff."""
+        return [row[0] for row in conn.execute("""
+            SELECT session_id FROM (
+                SELECT session_id, MAX(timestamp) AS last_activity FROM chats GROUP BY session_id
+                UNION ALL
+                SELECT session_id, created_at FROM sessions
+            )
+            WHERE session_id IS NOT NULL
+            GROUP BY session_id
+            HAVING MAX(last_activity) < ?
+        """, (cutoff,))]
+
+    def _archive_batch(self, conn: sqlite3.Connection, archive: sqlite3.Connection, session_ids: List[str]) -> int:
+        """Move sessions to the archive; returns the number of chat messages moved.
+
+        The archive is committed before the rows are deleted, so a crash in between
+        leaves a session in both files and the next run archives it again.
+        """
+        placeholders = ",".join("?" * len(session_ids))
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            chats = _select(conn, f"SELECT * FROM chats WHERE session_id IN ({placeholders}) ORDER BY id",
+                            tuple(session_ids))
+            sessions = _select(conn, f"SELECT * FROM sessions WHERE session_id IN ({placeholders})",
+                               tuple(session_ids))
+            records = []
+            for session_id in session_ids:
+                session_chats = [chat for chat in chats if chat["session_id"] == session_id]
+                session_rows = [row for row in sessions if row["session_id"] == session_id]
+                hashes = sorted({h for chat in session_chats for h in json.loads(chat["reference_ids"] or "[]")})
+                chunks = []
+                for batch in (hashes[i:i + 500] for i in range(0, len(hashes), 500)):
+                    chunks.extend(_select(conn, f"SELECT * FROM chunks WHERE hash IN ({','.join('?' * len(batch))})",
+                                          tuple(batch)))
+                codec, payload = _compress(json.dumps(
+                    {"sessions": session_rows, "chats": session_chats, "chunks": chunks}).encode())
+                first = session_rows[0] if session_rows else {}
+                chat_times = [chat["timestamp"] for chat in session_chats]
+                created_at = first.get("created_at") or min(chat_times)
+                records.append((session_id, first.get("name"), created_at, max(chat_times + [created_at]),
+                                len(session_chats), _now(), codec, payload))
+            with archive:
+                archive.executemany("""
+                    INSERT OR REPLACE INTO archived_sessions
+                        (session_id, name, created_at, last_activity, message_count, archived_at, codec, payload)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                """, records)
+            conn.execute(f"DELETE FROM chats WHERE session_id IN ({placeholders})", tuple(session_ids))
+            conn.execute(f"DELETE FROM sessions WHERE session_id IN ({placeholders})", tuple(session_ids))
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        return len(chats)
+
+    def _delete_unreferenced_chunks(self, conn: sqlite3.Connection) -> int:
+        """Delete reference chunks that no chat points to any more; returns how many.
+
+        Referenced hashes are collected outside any write transaction. Each delete
+        then only rechecks the chats written since, so chat writes are not held up.
+        """
+        newest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM chats").fetchone()[0]
+        referenced = {row[0] for row in conn.execute("""
+            SELECT DISTINCT j.value FROM chats c, json_each(c.reference_ids) j WHERE c.id <= ?
+        """, (newest,))}
+        unreferenced = [row[0] for row in conn.execute("SELECT hash FROM chunks") if row[0] not in referenced]
+        deleted = 0
+        for start in range(0, len(unreferenced), 500):
+            batch = unreferenced[start:start + 500]
+            with conn:
+                deleted += conn.execute(f"""
+                    DELETE FROM chunks WHERE hash IN ({','.join('?' * len(batch))}) AND hash NOT IN (
+                        SELECT j.value FROM chats c, json_each(c.reference_ids) j WHERE c.id > ?
+                    )
+                """, (*batch, newest)).rowcount
+        return deleted
+
+    def archive_idle_sessions(self, retention_days: int = HISTORY_RETENTION_DAYS) -> Dict:
+        """Move sessions idle for more than retention_days to the compressed archive."""
+        cutoff = (datetime.now(timezone.utc) - timedelta(days=retention_days)).strftime("%Y-%m-%d %H:%M:%S")
+        self.flush()
+        with self._maintenance_lock:
+            conn, archive = _connect(self.path), _connect(self.archive_path)
+            try:
+                session_ids = self._idle_sessions(conn, cutoff)
+                chats = 0
+                for start in range(0, len(session_ids), ARCHIVE_BATCH_SESSIONS):
+                    chats += self._archive_batch(conn, archive, session_ids[start:start + ARCHIVE_BATCH_SESSIONS])
+                chunks = self._delete_unreferenced_chunks(conn) if session_ids else 0
+            finally:
+                conn.close()
+                archive.close()
+        if session_ids:
+            self.version = next(self._versions)
+        return {'sessions': len(session_ids), 'chats': chats, 'chunks': chunks}
+
+    def restore_session(self, session_id: str) -> bool:
+        """Move an archived session back into the database; False if it is not archived."""
+        self.flush()
+        with self._maintenance_lock:
+            conn, archive = _connect(self.path), _connect(self.archive_path)
+            try:
+                row = archive.execute("""
+                    SELECT codec, payload FROM archived_sessions WHERE session_id = ?
+                """, (session_id,)).fetchone()
+                if row is None:
+                    return False
+                tables = json.loads(_decompress(*row))
+                # Rows keep their IDs, so restoring twice after an interrupted restore is harmless
+                with conn:
+                    for table in ("chunks", "sessions", "chats"):
+                        for record in tables[table]:
+                            conn.execute(f"""
+                                INSERT OR IGNORE INTO {table} ({", ".join(record)})
+                                VALUES ({", ".join("?" * len(record))})
+                            """, tuple(record.values()))
+                with archive:
+                    archive.execute("DELETE FROM archived_sessions WHERE session_id = ?", (session_id,))
+            finally:
+                conn.close()
+                archive.close()
+        self.version = next(self._versions)
+        return True
+
+    def maintain(self, retention_days: int = HISTORY_RETENTION_DAYS) -> Dict:
+        """Archive idle sessions (unless retention_days is 0), then compact the database and refresh
+        the query planner's statistics. Returns what was done and the sizes before and after."""
+        start = time.perf_counter()
+        size_before = _file_size(self.path)
+        archived = self.archive_idle_sessions(retention_days) if retention_days else \
+            {'sessions': 0, 'chats': 0, 'chunks': 0}
+        with self._maintenance_lock:
+            conn = _connect(self.path)
+            try:
+                # Deleted messages stay in the full-text index until the segments holding them are merged.
+                # After a large archival merge them all, in steps that commit in between; otherwise take one step.
+                remaining = conn.execute("SELECT COUNT(*) FROM chats").fetchone()[0]
+                merge_all = archived['chats'] > FTS_FULL_MERGE_SHARE * remaining
+                while True:
+                    changes = conn.total_changes
+                    with conn:
+                        conn.execute("INSERT INTO chats_fts (chats_fts, rank) VALUES ('merge', ?)",
+                                     (-FTS_MERGE_PAGES if merge_all else FTS_MERGE_PAGES,))
+                    if not merge_all or conn.total_changes - changes < 2:
+                        break
+                free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+                # executescript steps the pragma to completion; execute would free a single page
+                conn.executescript("PRAGMA incremental_vacuum;")
+                conn.execute(f"PRAGMA analysis_limit = {ANALYZE_ROW_LIMIT}")
+                conn.execute("ANALYZE")
+                conn.commit()
+                # Write the WAL back and truncate it, so the freed pages leave the main file now
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchall()
+                size_after = _file_size(self.path)
+                report = {
+                    'archived_sessions': archived['sessions'],
+                    'archived_chats': archived['chats'],
+                    'deleted_chunks': archived['chunks'],
+                    'freed_pages': free_pages,
+                    'size_before': size_before,
+                    'size_after': size_after,
+                    'reclaimed_bytes': max(0, size_before - size_after),
+                    'archive_size': _file_size(self.archive_path),
+                    'seconds': time.perf_counter() - start,
+                }
+                with conn:
+                    conn.execute("INSERT INTO maintenance_runs (ran_at, report) VALUES (?, ?)",
+                                 (_now(), json.dumps(report)))
+            finally:
+                conn.close()
+        return report
+
+    def _seconds_since_maintenance(self) -> float:
+        with self._read() as conn:
+            row = conn.execute("""
+                SELECT (julianday('now') - julianday(MAX(ran_at))) * 86400 FROM maintenance_runs
+            """).fetchone()
+        return row[0] if row[0] is not None else float("inf")
+
+    def start_maintenance(self, interval_hours: float = HISTORY_MAINTENANCE_HOURS) -> "ChatDatabase":
+        """Run maintain() in a daemon thread whenever the last run is more than interval_hours old."""
+        if interval_hours <= 0 or self._maintenance_thread is not None:
+            return self
+        interval = interval_hours * 3600
+
+        def run():
+            while True:
+                wait = interval - self._seconds_since_maintenance()
+                if wait > 0:
+                    time.sleep(wait)
+                    continue
+                try:
+                    print(format_maintenance_report(self.maintain()))
+                except Exception as e:
+                    print(f"Chat history maintenance failed: {e}")
+                    time.sleep(interval)
+
+        self._maintenance_thread = threading.Thread(target=run, name="chat-db-maintenance", daemon=True)
+        self._maintenance_thread.start()
+        return self
+
+
+class AsyncChatDatabase:
+    """Awaitable front for ChatDatabase, for use on an event loop.
+
+    Writes are already queued for the background writer and return at once;
+    reads run on worker threads against the read connection pool.
+    """
+
+    def __init__(self, db: ChatDatabase):
+        self.db = db
+
+    async def save_chat(self, *args, **kwargs):
+        self.db.save_chat(*args, **kwargs)
+
+    async def create_session(self, session_id: str, metadata: dict):
+        self.db.create_session(session_id, metadata)
+
+    async def get_chat_history(self, *args, **kwargs):
+        return await asyncio.to_thread(self.db.get_chat_history, *args, **kwargs)
+
+    async def get_summary(self, session_id: str) -> Dict:
+        return await asyncio.to_thread(self.db.get_summary, session_id)
+
+    async def get_session_summaries(self, limit: int = 50, offset: int = 0) -> List[Dict]:
+        return await asyncio.to_thread(self.db.get_session_summaries, limit, offset)
+
+    async def get_references(self, chat_id: int) -> List[Dict]:
+        return await asyncio.to_thread(self.db.get_references, chat_id)
+
+    async def search(self, query: str, limit: int = CHAT_SEARCH_RESULTS) -> List[Dict]:
+        return await asyncio.to_thread(self.db.search, query, limit)
+
+def _file_size(path: str) -> int:
+    return sum(os.path.getsize(p) for p in (path, path + "-wal") if os.path.exists(p))
+
+
+def format_maintenance_report(report: Dict) -> str:
+    return (f"Chat history maintenance: archived {report['archived_sessions']} sessions "
+            f"({report['archived_chats']} messages, {report['deleted_chunks']} reference chunks), "
+            f"reclaimed {report['reclaimed_bytes'] / 2**20:.1f} MB; database {report['size_after'] / 2**20:.1f} MB, "
+            f"archive {report['archive_size'] / 2**20:.1f} MB ({report['seconds']:.1f}s)")
+
+
+def _time_history_reads(read, session_ids: List[str], repeat: int = 3) -> Tuple[float, float]:
+    """Median and worst per-session history read latency in milliseconds."""
+    latencies = []
+    for _ in range(repeat):
+        for session_id in session_ids:
+            start = time.perf_counter()
+            read(session_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return (latencies[len(latencies) // 2], latencies[-1]) if latencies else (0.0, 0.0)
+
+
+def migrate_references(path: str = DB_PATH, sample: int = 200):
+    """Run the reference storage migration and report size and history-read latency before and after."""
+    if not os.path.exists(path):
+        print(f"No chat history database at {path}; nothing to migrate.")
+        return
+    conn = _connect(path)
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    if not conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chats'").fetchone():
+        conn.close()
+        print(f"{path} has no chat history yet; nothing to migrate.")
+        return
+    session_ids = [row[0] for row in conn.execute(
+        "SELECT DISTINCT session_id FROM chats LIMIT ?", (sample,)).fetchall()]
+
+    def legacy_read(session_id):
+        # What get_chat_history did before: fetch and decode every reference blob
+        rows = conn.execute("""
+            SELECT user_message, response, reference_docs FROM chats
+            WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?
+        """, (session_id, HISTORY_CONTEXT)).fetchall()
+        return [json.loads(row[2]) if row[2] else [] for row in rows]
+
+    if version >= 3:
+        print("References are already content-addressed.")
+    else:
+        size_before = _file_size(path)
+        before = _time_history_reads(legacy_read, session_ids)
+    conn.close()
+
+    db = ChatDatabase(path)
+    after = _time_history_reads(db.get_chat_history, session_ids)
+    size_after = _file_size(path)
+    if version < 3:
+        print(f"Database size: {size_before / 2**20:.1f} MB -> {size_after / 2**20:.1f} MB")
+        print(f"History read (median / max over {len(session_ids)} sessions): "
+              f"{before[0]:.2f} / {before[1]:.2f} ms -> {after[0]:.2f} / {after[1]:.2f} ms")
+    else:
+        print(f"Database size: {size_after / 2**20:.1f} MB, history read median {after[0]:.2f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Chat history database maintenance.")
+    parser.add_argument("--db", default=DB_PATH, help="Path to the chat history database")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("migrate-references", help="Move reference text into the content-addressed chunks table")
+    maintain = commands.add_parser("maintain", help="Archive idle sessions, compact the database and run ANALYZE")
+    maintain.add_argument("--retention-days", type=int, default=HISTORY_RETENTION_DAYS,
+                          help="Archive sessions idle for longer than this (0 keeps everything)")
+    restore = commands.add_parser("restore", help="Move an archived session back into the database")
+    restore.add_argument("session_id")
+    args = parser.parse_args(argv)
+
+    if args.command == "migrate-references":
+        migrate_references(args.db)
+    elif args.command == "maintain":
+        print(format_maintenance_report(ChatDatabase(args.db).maintain(args.retention_days)))
+    elif args.command == "restore":
+        restored = ChatDatabase(args.db).restore_session(args.session_id)
+        print(f"Restored {args.session_id}" if restored else f"{args.session_id} is not archived")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
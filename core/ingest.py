@@ -0,0 +1,250 @@
+import os
+import time
+import queue
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+
+from .config import (INGEST_WORKERS, EMBED_BATCH_SIZE, INGEST_QUEUE_PAGES, INGEST_START_METHOD, CHUNK_SIZE,
+                     CHUNK_OVERLAP)
+
+WORKER_POLL_SECONDS = 1.0   # How often an idle queue is checked for workers that died without reporting
+PARSER_MODULES = ["core.ingest", "langchain_community.document_loaders.pdf", "langchain.text_splitter", "pypdf"]  # Preloaded by the fork server
+
+
+def chunk_id(filename: str, page: Any, text: str, occurrence: int = 0) -> str:
+    """Stable chunk ID: unchanged chunks keep their ID when the rest of the file changes."""
+    digest = hashlib.sha256(f"{filename}\0{page}\0{text}".encode()).hexdigest()[:32]
+    return digest if occurrence == 0 else f"{digest}-{occurrence}"
+
+
+def split_pages(filepath: str) -> Iterator[List[Tuple[str, str, Dict]]]:
+    """Parse a PDF one page at a time, yielding each page's (id, text, metadata) chunks."""
+    from langchain_community.document_loaders import PyPDFLoader
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    filename = os.path.basename(filepath)
+    seen: Dict[Tuple[Any, str], int] = {}
+    for page in PyPDFLoader(filepath).lazy_load():
+        chunks = []
+        for chunk in splitter.split_documents([page]):
+            key = (chunk.metadata.get("page"), chunk.page_content)
+            occurrence = seen.get(key, 0)
+            seen[key] = occurrence + 1
+            chunks.append((chunk_id(filename, key[0], key[1], occurrence), chunk.page_content, chunk.metadata))
+        yield chunks
+
+
+def _worker_context():
+    """Multiprocessing context for the parser processes.
+
+    Forking the app, whose other threads may hold torch, tokenizers or sqlite locks,
+    can leave the children deadlocked. A fork server is a clean single-threaded
+    process started once; it imports the parser up front, so workers start in
+    milliseconds rather than re-importing it like spawned ones.
+    """
+    method = INGEST_START_METHOD
+    if method not in multiprocessing.get_all_start_methods():
+        method = "spawn"  # e.g. no fork server on Windows
+    context = multiprocessing.get_context(method)
+    if method == "forkserver":
+        context.set_forkserver_preload(PARSER_MODULES)
+    return context
+
+
+def stream_file(filepath: str, out_queue):
+    """Put ("page", filepath, chunks) per page, then ("done" | "error", filepath, detail). Runs in a worker process."""
+    try:
+        for chunks in split_pages(filepath):
+            out_queue.put(("page", filepath, chunks))  # Blocks while the queue is full
+        out_queue.put(("done", filepath, None))
+    except Exception as e:
+        out_queue.put(("error", filepath, repr(e)))
+
+
+# Document Ingestion Pipeline
+class IngestionPipeline:
+    """Streams PDFs page -> chunks -> embeddings -> vector store with bounded memory.
+
+    Worker processes parse pages into a queue holding at most queue_pages pages,
+    so parsing waits for embedding instead of piling up. Chunks are embedded with
+    one embed_documents call and written with one bulk upsert per batch, and added
+    to the lexical index first so every chunk in the vector store is also indexed.
+    Both writes of a batch happen inside store_lock(), which callers serving
+    queries at the same time use to make each batch appear at once.
+    on_file is called once every chunk of a file is persisted, which is the point
+    where the file may be recorded as processed.
+    """
+
+    def __init__(self, embeddings, store, workers: int = INGEST_WORKERS, batch_size: int = EMBED_BATCH_SIZE,
+                 lexical=None, queue_pages: int = INGEST_QUEUE_PAGES, store_lock: Callable = nullcontext):
+        self.embeddings = embeddings
+        self.store = store
+        self.lexical = lexical
+        self.store_lock = store_lock
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.queue_pages = max(1, queue_pages)
+        self.stats = {"files": 0, "pages": 0, "chunks": 0, "unchanged_chunks": 0, "failed_files": 0,
+                      "parse_seconds": 0.0, "embed_seconds": 0.0, "write_seconds": 0.0}
+
+    def _messages(self, filepaths: List[str]) -> Iterator[Tuple[str, str, Any]]:
+        """Yield stream_file messages of all files, parsing in a process pool when there are several."""
+        if self.workers == 1 or len(filepaths) == 1:
+            for filepath in filepaths:
+                try:
+                    for chunks in split_pages(filepath):
+                        yield "page", filepath, chunks
+                    yield "done", filepath, None
+                except Exception as e:
+                    yield "error", filepath, repr(e)
+            return
+        context = _worker_context()
+        with context.Manager() as manager:
+            out_queue = manager.Queue(maxsize=self.queue_pages)
+            pool = ProcessPoolExecutor(max_workers=min(self.workers, len(filepaths)), mp_context=context)
+            try:
+                futures = {pool.submit(stream_file, filepath, out_queue): filepath for filepath in filepaths}
+                unfinished = set(filepaths)
+                while unfinished:
+                    try:
+                        message = out_queue.get(timeout=WORKER_POLL_SECONDS)
+                    except queue.Empty:
+                        # A worker killed mid-file (e.g. by the OOM killer) never sends "done" or "error";
+                        # its future fails with BrokenProcessPool instead
+                        for future, filepath in futures.items():
+                            if filepath in unfinished and future.done() and future.exception() is not None:
+                                unfinished.discard(filepath)
+                                yield "error", filepath, repr(future.exception())
+                        continue
+                    if message[0] != "page":
+                        unfinished.discard(message[1])
+                    yield message
+            finally:
+                # Workers blocked on a full queue are released when the manager shuts down
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def _write_batch(self, batch: List[Tuple[str, str, Dict]]):
+        ids = [chunk_id for chunk_id, _, _ in batch]
+        texts = [text for _, text, _ in batch]
+        metadatas = [metadata for _, _, metadata in batch]
+
+        start = time.perf_counter()
+        vectors = self.embeddings.embed_documents(texts)
+        self.stats["embed_seconds"] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        with self.store_lock():
+            if self.lexical is not None:
+                self.lexical.add(ids, texts, metadatas)
+            self.store.upsert(ids, vectors, texts, metadatas)
+        self.stats["write_seconds"] += time.perf_counter() - start
+        self.stats["chunks"] += len(batch)
+
+    def _report(self, started: float, total_files: int):
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        print(f"[ingest] {self.stats['files']}/{total_files} files, {self.stats['pages']} pages, "
+              f"{self.stats['chunks']} chunks | {self.stats['pages'] / elapsed:.1f} pages/s, "
+              f"{self.stats['chunks'] / elapsed:.1f} chunks/s")
+
+    def run(self, filepaths: List[str], existing_ids: Optional[Dict[str, Set[str]]] = None,
+            on_file: Optional[Callable[[str, List[str]], None]] = None) -> Dict:
+        """Ingest the given PDFs and return throughput statistics.
+
+        Chunks whose ID is already in existing_ids[filepath] are not re-embedded.
+        on_file(filepath, chunk_ids) receives the IDs of all current chunks of each
+        file once they are persisted; files that fail to parse are left out.
+        """
+        existing_ids = existing_ids or {}
+        started = time.perf_counter()
+        pending: List[Tuple[str, Tuple[str, str, Dict]]] = []
+        outstanding: Dict[str, int] = {}      # Chunks per file waiting in pending
+        file_ids: Dict[str, List[str]] = {}
+        file_pages: Dict[str, int] = {}
+        parsed: Set[str] = set()
+
+        def finish(filepath: str):
+            self.stats["files"] += 1
+            print(f"Processed {os.path.basename(filepath)}: {file_pages[filepath]} pages, "
+                  f"{len(file_ids[filepath])} chunks")
+            if on_file is not None:
+                on_file(filepath, file_ids.pop(filepath))
+            parsed.discard(filepath)
+            self._report(started, len(filepaths))
+
+        def flush(size: int):
+            nonlocal pending
+            batch, pending = pending[:size], pending[size:]
+            self._write_batch([chunk for _, chunk in batch])
+            for filepath, _ in batch:
+                outstanding[filepath] -= 1
+            for filepath in [f for f in parsed if not outstanding[f]]:
+                finish(filepath)
+
+        parse_started = started
+        for kind, filepath, payload in self._messages(filepaths):
+            self.stats["parse_seconds"] += time.perf_counter() - parse_started
+            file_ids.setdefault(filepath, [])
+            file_pages.setdefault(filepath, 0)
+            outstanding.setdefault(filepath, 0)
+            if kind == "page":
+                self.stats["pages"] += 1
+                file_pages[filepath] += 1
+                known = existing_ids.get(filepath, set())
+                for chunk in payload:
+                    file_ids[filepath].append(chunk[0])
+                    if chunk[0] in known:
+                        self.stats["unchanged_chunks"] += 1
+                    else:
+                        pending.append((filepath, chunk))
+                        outstanding[filepath] += 1
+                while len(pending) >= self.batch_size:
+                    flush(self.batch_size)
+            elif kind == "done":
+                parsed.add(filepath)
+                if not outstanding[filepath]:
+                    finish(filepath)
+            else:
+                # Already written chunks are kept and skipped when the file is retried
+                print(f"Failed to ingest {os.path.basename(filepath)}: {payload}")
+                self.stats["failed_files"] += 1
+                file_ids.pop(filepath, None)
+            parse_started = time.perf_counter()
+
+        if pending:
+            flush(len(pending))
+
+        elapsed = time.perf_counter() - started
+        self.stats["seconds"] = elapsed
+        self.stats["pages_per_second"] = self.stats["pages"] / elapsed if elapsed else 0.0
+        self.stats["chunks_per_second"] = self.stats["chunks"] / elapsed if elapsed else 0.0
+        return self.stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest PDFs from PROCESSED_FOLDER into the vector store.")
+    parser.add_argument("--workers", type=int, default=INGEST_WORKERS, help="Parser processes")
+    parser.add_argument("--batch-size", type=int, default=EMBED_BATCH_SIZE, help="Chunks per embedding batch")
+    args = parser.parse_args()
+
+    from .retriever import DocumentRetriever
+    retriever = DocumentRetriever(auto_ingest=False)
+    stats = retriever.ingest(workers=args.workers, batch_size=args.batch_size)
+    if stats["removed_files"] or stats["deleted_chunks"]:
+        print(f"Removed {stats['removed_files']} deleted files, {stats['deleted_chunks']} stale chunks")
+    if not stats["files"]:
+        print("Vector store is up to date.")
+        return
+    print(f"Ingested {stats['files']} files ({stats['pages']} pages, {stats['chunks']} chunks) "
+          f"in {stats['seconds']:.1f}s: {stats['pages_per_second']:.1f} pages/s, "
+          f"{stats['chunks_per_second']:.1f} chunks/s "
+          f"(parse wait {stats['parse_seconds']:.1f}s, embed {stats['embed_seconds']:.1f}s, "
+          f"write {stats['write_seconds']:.1f}s); {stats['unchanged_chunks']} unchanged chunks kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .config import LEXICAL_INDEX_PATH, BM25_K1, BM25_B
+
+DENSE_TERMS = 32        # Frequent terms whose impacts are cached as dense arrays
+DENSE_FRACTION = 0.125  # Terms in more than this share of documents are scored densely
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "has", "he", "in", "is",
+    "it", "its", "of", "on", "or", "that", "the", "to", "was", "were", "will", "with", "this",
+    "which", "shall", "such", "any", "been", "being", "into", "not", "no", "but", "if", "than",
+    "then", "there", "these", "those", "who", "whom", "what", "when", "where", "how", "do",
+    "does", "did", "can", "could", "would", "should", "may", "might", "i", "me", "my", "we",
+    "our", "you", "your", "they", "their", "them", "she", "her", "his", "him",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased word and number tokens; numbers are kept for section lookups."""
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if t not in STOPWORDS]
+
+
+# Lexical (BM25) Index
+class BM25Index:
+    """Persistent inverted index with BM25 scoring.
+
+    Postings are stored per term as packed (doc, tf) arrays. Every add() appends
+    one segment per touched term, so updates never rewrite the whole index;
+    deletes only tombstone documents. compact() merges segments and drops
+    postings of deleted documents. Searches are vectorized over the postings
+    arrays held in memory.
+    """
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH, k1: float = BM25_K1, b: float = BM25_B):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                chunk_id TEXT UNIQUE,
+                length INTEGER,
+                text TEXT,
+                metadata TEXT
+            )
+        """)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT,
+                doc_ids BLOB,
+                tfs BLOB
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_postings_term ON postings (term)")
+        self.conn.commit()
+        self._load()
+
+    def _load(self):
+        rows = self.conn.execute("SELECT id, chunk_id, length FROM docs").fetchall()
+        # Size by the highest ID ever issued: postings may still reference deleted documents
+        sequence = self.conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'docs'").fetchone()
+        size = (sequence[0] if sequence else 0) + 1
+        self._lengths = np.zeros(size, dtype=np.float32)
+        self._alive = np.zeros(size, dtype=bool)
+        self._chunk_ids: Dict[int, str] = {}
+        for doc_id, chunk_id, length in rows:
+            self._lengths[doc_id] = length
+            self._alive[doc_id] = True
+            self._chunk_ids[doc_id] = chunk_id
+        self._row_ids = {chunk_id: doc_id for doc_id, chunk_id in self._chunk_ids.items()}
+        self._total_length = float(self._lengths.sum())
+
+        segments = defaultdict(list)
+        for term, doc_ids, tfs in self.conn.execute("SELECT term, doc_ids, tfs FROM postings ORDER BY rowid"):
+            segments[term].append((np.frombuffer(doc_ids, dtype=np.int32), np.frombuffer(tfs, dtype=np.float32)))
+        self._postings: Dict[str, Tuple[np.ndarray, np.ndarray]] = {
+            term: (np.concatenate([s[0] for s in parts]), np.concatenate([s[1] for s in parts]))
+            for term, parts in segments.items()
+        }
+        self._segments = sum(len(parts) for parts in segments.values())
+        self._deleted = 0
+        # Per-term BM25 term-frequency components, valid for the average length they were computed with.
+        # Frequent terms are cached as dense arrays (LRU bounded) so scoring them is a single vector add.
+        self._impacts: Dict[str, np.ndarray] = {}
+        self._dense: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._impact_avg_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._row_ids)
+
+    def _grow(self, size: int):
+        if size > len(self._lengths):
+            capacity = max(size, 2 * len(self._lengths))
+            self._lengths = np.concatenate([self._lengths, np.zeros(capacity - len(self._lengths), dtype=np.float32)])
+            self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+
+    def add(self, ids: List[str], texts: List[str], metadatas: Optional[List[Dict]] = None):
+        """Index chunks; existing chunks with the same ID are replaced."""
+        metadatas = metadatas or [{} for _ in ids]
+        with self._lock:
+            self._delete([chunk_id for chunk_id in ids if chunk_id in self._row_ids])
+            new_postings = defaultdict(lambda: ([], []))
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                doc_id = self.conn.execute("""
+                    INSERT INTO docs (chunk_id, length, text, metadata) VALUES (?, ?, ?, ?)
+                """, (chunk_id, length, text, json.dumps(metadata))).lastrowid
+                self._grow(doc_id + 1)
+                self._lengths[doc_id] = length
+                self._alive[doc_id] = True
+                self._chunk_ids[doc_id] = chunk_id
+                self._row_ids[chunk_id] = doc_id
+                self._total_length += length
+                for term, tf in counts.items():
+                    new_postings[term][0].append(doc_id)
+                    new_postings[term][1].append(tf)
+
+            rows = []
+            for term, (doc_ids, tfs) in new_postings.items():
+                doc_ids = np.asarray(doc_ids, dtype=np.int32)
+                tfs = np.asarray(tfs, dtype=np.float32)
+                rows.append((term, doc_ids.tobytes(), tfs.tobytes()))
+                if term in self._postings:
+                    old_ids, old_tfs = self._postings[term]
+                    doc_ids, tfs = np.concatenate([old_ids, doc_ids]), np.concatenate([old_tfs, tfs])
+                self._postings[term] = (doc_ids, tfs)
+                self._impacts.pop(term, None)
+                self._dense.pop(term, None)
+            self.conn.executemany("INSERT INTO postings (term, doc_ids, tfs) VALUES (?, ?, ?)", rows)
+            self._segments += len(rows)
+            self.conn.commit()
+
+    def _delete(self, ids: List[str]):
+        for chunk_id in ids:
+            doc_id = self._row_ids.pop(chunk_id, None)
+            if doc_id is None:
+                continue
+            del self._chunk_ids[doc_id]
+            self._total_length -= float(self._lengths[doc_id])
+            self._alive[doc_id] = False
+            self._lengths[doc_id] = 0
+            self._deleted += 1
+            self.conn.execute("DELETE FROM docs WHERE id = ?", (doc_id,))
+
+    def delete(self, ids: List[str]):
+        """Remove chunks from the index. Their postings are dropped on the next compact()."""
+        with self._lock:
+            self._delete(ids)
+            self.conn.commit()
+
+    def compact(self):
+        """Merge posting segments into one row per term and drop deleted documents."""
+        with self._lock:
+            rows = []
+            for term, (doc_ids, tfs) in list(self._postings.items()):
+                keep = self._alive[doc_ids]
+                doc_ids, tfs = doc_ids[keep], tfs[keep]
+                if len(doc_ids):
+                    self._postings[term] = (doc_ids, tfs)
+                    rows.append((term, doc_ids.tobytes(), tfs.tobytes()))
+                else:
+                    del self._postings[term]
+            self._impacts.clear()
+            self._dense.clear()
+            self.conn.execute("DELETE FROM postings")
+            self.conn.executemany("INSERT INTO postings (term, doc_ids, tfs) VALUES (?, ?, ?)", rows)
+            self.conn.commit()
+            self.conn.execute("VACUUM")
+            self._segments = len(rows)
+            self._deleted = 0
+
+    def needs_compaction(self) -> bool:
+        """True when posting segments or deleted documents make up a large share of the index."""
+        return (self._segments > 2 * max(len(self._postings), 1) or
+                self._deleted > 0.25 * max(len(self._row_ids), 1))
+
+    def _impact(self, term: str, doc_ids: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        impact = self._impacts.get(term)
+        if impact is None:
+            norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_ids] / self._impact_avg_length)
+            impact = (tfs * (self.k1 + 1) / (tfs + norm)).astype(np.float32)
+            self._impacts[term] = impact
+        return impact
+
+    def _dense_impact(self, term: str, doc_ids: np.ndarray, tfs: np.ndarray) -> np.ndarray:
+        dense = self._dense.get(term)
+        if dense is None or len(dense) != len(self._lengths):
+            dense = np.zeros(len(self._lengths), dtype=np.float32)
+            dense[doc_ids] = self._impact(term, doc_ids, tfs)
+            self._dense[term] = dense
+            if len(self._dense) > DENSE_TERMS:
+                self._dense.popitem(last=False)
+        self._dense.move_to_end(term)
+        return dense
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """Return up to k (chunk_id, score) pairs ranked by BM25."""
+        with self._lock:
+            doc_count = len(self._row_ids)
+            if not doc_count:
+                return []
+            avg_length = self._total_length / doc_count
+            if abs(avg_length - self._impact_avg_length) > 0.02 * avg_length:
+                # Average length drifted with updates: recompute impacts lazily
+                self._impacts.clear()
+                self._dense.clear()
+                self._impact_avg_length = avg_length
+
+            scores = np.zeros(len(self._lengths), dtype=np.float32)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if postings is None:
+                    continue
+                doc_ids, tfs = postings
+                df = len(doc_ids)
+                idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                if df > DENSE_FRACTION * len(scores):
+                    scores += idf * self._dense_impact(term, doc_ids, tfs)
+                else:
+                    # A document appears at most once per term, so plain fancy indexing is safe
+                    scores[doc_ids] += idf * self._impact(term, doc_ids, tfs)
+            scores[~self._alive] = 0
+
+            if k < len(scores):
+                candidates = np.argpartition(-scores, k)[:k]
+            else:
+                candidates = np.arange(len(scores))
+            ranked = candidates[np.argsort(-scores[candidates])]
+            return [(self._chunk_ids[int(i)], float(scores[i])) for i in ranked if scores[i] > 0]
+
+    def get_documents(self, ids: List[str]) -> Dict[str, Document]:
+        """Fetch stored chunk text and metadata by chunk ID."""
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self.conn.execute(f"""
+                SELECT chunk_id, text, metadata FROM docs WHERE chunk_id IN ({placeholders})
+            """, ids).fetchall()
+        return {
+            chunk_id: Document(page_content=text, metadata=json.loads(metadata))
+            for chunk_id, text, metadata in rows
+        }
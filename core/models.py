@@ -1,12 +1,21 @@
-
+import time
+import uuid
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
-from langchain_groq import ChatGroq
-from typing import List, Any, Dict, TypedDict, Annotated, Optional
+from typing import List, Any, AsyncIterator, Callable, Dict, Iterator, TypedDict, Annotated, Optional
 from langgraph.graph import StateGraph, END
-from .database import ChatDatabase
-from .retriever import DocumentRetriever
+from langgraph.config import get_stream_writer
+from . import resources
+from .database import AsyncChatDatabase
+from .router import LLMRouter, create_router
+from .context import ContextPacker, count_tokens
+from .summary import ConversationSummarizer
+from .tracing import annotate
 
-from .config import LLM_API_KEY, LLM_MODEL, HISTORY_CONTEXT
+from .config import (HISTORY_CONTEXT, ROUTER_MODE, ROUTER_CONFIDENCE, SUMMARY_ENABLED, TRACING_ENABLED, RETRIEVE_DOCS,
+                     SPECULATIVE_EXECUTION, SPECULATIVE_WORKERS)
 
 # LLM Response Generation
 # State Definition
@@ -15,18 +24,14 @@ class ChatState(TypedDict):
     user_message: str
     reference_docs: Optional[List[Any]]
     response: Optional[str]
+    prompt_tokens: Optional[int]
     requires_retrieval: bool
     history: List[Dict[str, Any]]
+    summary: Optional[str]
+    trace_id: Optional[str]
+    run_id: Optional[str]
 
-# LLM Response Generation
-class ResponseGenerator:
-    def __init__(self):
-        self.llm = ChatGroq(api_key=LLM_API_KEY, 
-                          model=LLM_MODEL)
-
-    def generate_response(self, context: str, history: str, query: str) -> str:
-        messages = [
-            SystemMessage(content="""
+SYSTEM_PROMPT = """
             You are an AI assistant with expertise in various topics, including legal definitions, documentation, and general knowledge.
             
             - If the user's query is related to **legal matters** (e.g., laws, regulations, contracts, legal definitions, compliance), respond in a **professional and informative** manner.
@@ -36,50 +41,237 @@ class ResponseGenerator:
             - If the query is **ambiguous**, ask for clarification instead of assuming.
 
             Always ensure that responses are **clear, concise, and factually correct**.
-            """),
+            """
+
+# LLM Response Generation
+class ResponseGenerator:
+    @property
+    def llm(self):
+        return resources.get_llm()
+
+    def _build_messages(self, context: str, history: str, query: str) -> List[Any]:
+        return [
+            SystemMessage(content=SYSTEM_PROMPT),
             HumanMessage(content=f"Context:\n{context}\n\nConversation History:\n{history}\n\nUser Query:\n{query}\n\nResponse:")
         ]
 
-        return self.llm(messages).content
+    def prompt_tokens(self, context: str, history: str, query: str) -> int:
+        """Estimated size of the prompt in tokens."""
+        return sum(count_tokens(message.content) for message in self._build_messages(context, history, query))
+
+    def generate_response(self, context: str, history: str, query: str) -> str:
+        return self.llm.invoke(self._build_messages(context, history, query)).content
+
+    def stream_response(self, context: str, history: str, query: str) -> Iterator[str]:
+        """Yield response tokens as they arrive from the LLM."""
+        for chunk in self.llm.stream(self._build_messages(context, history, query)):
+            if chunk.content:
+                yield chunk.content
+
+    async def astream_response(self, context: str, history: str, query: str) -> AsyncIterator[str]:
+        """Async version of stream_response."""
+        async for chunk in self.llm.astream(self._build_messages(context, history, query)):
+            if chunk.content:
+                yield chunk.content
 
     
     def custom_call(self, user_prompt, system_prompt=None):
         messages = [HumanMessage(content=user_prompt)]
         if system_prompt:
             messages.insert(0, SystemMessage(system_prompt))
-        return self.llm(messages).content
+        return self.llm.invoke(messages).content
+
+def _timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - start) * 1000
+
 
 # Chat Nodes Class
 class ChatNodes:
-    def __init__(self):
-        self.db = ChatDatabase()
-        self.retriever = DocumentRetriever()
+    def __init__(self, speculative: bool = SPECULATIVE_EXECUTION):
+        self.db = resources.get_database()
+        self.adb = AsyncChatDatabase(self.db)
         self.generator = ResponseGenerator()
+        self.packer = ContextPacker()
+        self.summarizer = ConversationSummarizer(self.generator, self.db) if SUMMARY_ENABLED else None
+        self.router = create_router(
+            ROUTER_MODE,
+            embeddings=resources.CachedQueryEmbeddings(),
+            llm_fallback=LLMRouter(self.generator),
+            threshold=ROUTER_CONFIDENCE
+        )
+        # Speculative mode: retrieval and history loading start alongside routing, keyed by run ID
+        self.speculative = speculative
+        self.executor = ThreadPoolExecutor(SPECULATIVE_WORKERS, thread_name_prefix="speculative") if speculative else None
+        self._pending: Dict[str, Dict] = {}
+        self._stats_lock = threading.Lock()
+        self.speculation = {"retrievals": 0, "discarded": 0, "retrieval_saved_ms": 0.0, "history_saved_ms": 0.0}
 
-    def retrieve_documents(self, state: ChatState) -> Dict:
-        docs = self.retriever.retrieve_documents(state["user_message"])
+    @property
+    def retriever(self):
+        # Shared and loaded lazily: the embedding model and vector store are the slow part of startup
+        return resources.get_retriever()
+
+    def load_history(self, session_id: str) -> Dict:
+        """Rolling summary plus the turns it does not cover yet, newest first."""
+        summary = self.db.get_summary(session_id)
+        history = self.db.get_chat_history(session_id, limit=HISTORY_CONTEXT, after_id=summary['summarized_until'])
+        return {
+            "summary": summary['summary'],
+            "history": [
+                {"user_message": h['user_message'], "response": h["response"], "reference_docs": []}
+                for h in history
+            ]
+        }
+
+    async def aload_history(self, session_id: str) -> Dict:
+        """Async version of load_history; the reads run off the event loop."""
+        summary = await self.adb.get_summary(session_id)
+        history = await self.adb.get_chat_history(session_id, limit=HISTORY_CONTEXT,
+                                                  after_id=summary['summarized_until'])
+        return {
+            "summary": summary['summary'],
+            "history": [
+                {"user_message": h['user_message'], "response": h["response"], "reference_docs": []}
+                for h in history
+            ]
+        }
+
+    def _speculate(self, state: ChatState) -> Callable[[], List[float]]:
+        """Start retrieval and history loading; returns the query embedding shared with the router."""
+        # Every graph run gets an ID, so concurrent runs never share or overwrite pending work
+        run_id = state.setdefault("run_id", uuid.uuid4().hex)
+        query = state["user_message"]
+        # The retriever is resolved on the worker too, in case it is still loading
+        embedding = self.executor.submit(lambda: self.retriever.embed_query(query))
+        retrieve = lambda: self.retriever.retrieve_documents(query, embedding=embedding.result)
+        pending = {"embedding": embedding, "retrieve": self.executor.submit(_timed, retrieve)}
+        if "history" not in state:
+            pending["history"] = self.executor.submit(_timed, self.load_history, state["session_id"])
+        self._pending[run_id] = pending
+        return embedding.result
+
+    def _pop_pending(self, state: ChatState, name: str):
+        return self._pending.get(state.get("run_id"), {}).pop(name, None)
+
+    def discard_speculation(self, run_id: str):
+        """Cancel and forget whatever speculative work of a run is left; safe to call more than once."""
+        for future in self._pending.pop(run_id, {}).values():
+            future.cancel()
+
+    def _record_saving(self, stat: str, duration_ms: float, waited_ms: float):
+        """The time a speculative job ran before anyone waited for it is the latency it saved."""
+        saved_ms = max(0.0, duration_ms - waited_ms)
+        with self._stats_lock:
+            self.speculation[stat] += saved_ms
+            if stat == "retrieval_saved_ms":
+                self.speculation["retrievals"] += 1
+        annotate(**{stat: saved_ms})
+
+    def _collect(self, state: ChatState, name: str, stat: str):
+        future = self._pop_pending(state, name)
+        if future is None:
+            return None
+        start = time.perf_counter()
+        result, duration_ms = future.result()
+        self._record_saving(stat, duration_ms, (time.perf_counter() - start) * 1000)
+        return result
+
+    async def _acollect(self, state: ChatState, name: str, stat: str):
+        future = self._pop_pending(state, name)
+        if future is None:
+            return None
+        start = time.perf_counter()
+        result, duration_ms = await asyncio.wrap_future(future)
+        self._record_saving(stat, duration_ms, (time.perf_counter() - start) * 1000)
+        return result
+
+    def speculation_stats(self) -> Dict:
+        """Speculative retrievals used and discarded, and the latency they saved in total."""
+        with self._stats_lock:
+            return dict(self.speculation)
+
+    def _routed(self, state: ChatState, requires_retrieval: bool) -> ChatState:
+        state['requires_retrieval'] = requires_retrieval
+        if self.speculative and not requires_retrieval:
+            # Router said no: throw the speculative retrieval away
+            retrieval = self._pop_pending(state, "retrieve")
+            if retrieval is not None:
+                retrieval.cancel()
+            with self._stats_lock:
+                self.speculation["discarded"] += 1
+        annotate(requires_retrieval=requires_retrieval)
+        return state
+
+    def _retrieved(self, docs) -> Dict:
+        annotate(k=RETRIEVE_DOCS, hits=len(docs))
         return {"reference_docs": docs}
 
+    def _prompt(self, state: ChatState, conversation: Dict):
+        """Pack context and history into the token budget; returns (context, history, prompt_tokens)."""
+        query = state["user_message"]
+        # Overlapping chunks are merged and everything is fitted into the model's token budget
+        context, history = self.packer.pack(
+            state.get("reference_docs") or [],
+            conversation["history"][:HISTORY_CONTEXT],
+            fixed_tokens=self.generator.prompt_tokens("", "", query),
+            summary=conversation["summary"] or ""
+        )
+        return context, history, self.generator.prompt_tokens(context, history, query)
+
+    def _generated(self, response: str, prompt_tokens: int, conversation: Dict) -> Dict:
+        annotate(prompt_tokens=prompt_tokens, completion_tokens=count_tokens(response))
+        return {"response": response, "prompt_tokens": prompt_tokens, **conversation}
+
+    @staticmethod
+    def _given_conversation(state: ChatState) -> Optional[Dict]:
+        if "history" in state:
+            return {"history": state["history"], "summary": state.get("summary")}
+        return None
+
+    def retrieve_documents(self, state: ChatState) -> Dict:
+        docs = self._collect(state, "retrieve", "retrieval_saved_ms")
+        if docs is None:
+            docs = self.retriever.retrieve_documents(state["user_message"])
+        return self._retrieved(docs)
+
     def generate_response(self, state: ChatState) -> Dict:
-        context = "\n\n".join([doc.page_content for doc in state["reference_docs"]])
-        history = "\n".join([f"User: {msg['user_message']}\nBot: {msg['response']}" 
-                           for msg in state.get("history", [])[-HISTORY_CONTEXT:]])
-        response = self.generator.generate_response(
+        try:
+            conversation = (self._given_conversation(state) or
+                            self._collect(state, "history", "history_saved_ms") or
+                            self.load_history(state["session_id"]))
+        finally:
+            # Generation is the last node to use speculative results
+            self.discard_speculation(state.get("run_id"))
+        context, history, prompt_tokens = self._prompt(state, conversation)
+        # Forward tokens to the "custom" stream while accumulating the full text for the save node
+        writer = get_stream_writer()
+        response = ""
+        for token in self.generator.stream_response(
             context=context,
             history=history,
             query=state["user_message"]
-        )
-        return {"response": response}    
-
-
+        ):
+            response += token
+            writer({"token": token})
+        return self._generated(response, prompt_tokens, conversation)
 
     def save_conversation(self, state: ChatState) -> Dict:
+        start = time.perf_counter()
         self.db.save_chat(
             state["session_id"],
             state["user_message"],
             state["response"],
-            reference_docs=state["reference_docs"]
+            reference_docs=state.get("reference_docs") or [],
+            prompt_tokens=state.get("prompt_tokens"),
+            trace_id=state.get("trace_id")
         )
+        # Time to hand the rows to the write-behind queue; the commit happens on its thread
+        annotate(db_write_ms=(time.perf_counter() - start) * 1000)
+        # History holds the turns the summary does not cover yet; fold them in once they overflow
+        if self.summarizer and self.summarizer.needs_update(len(state.get("history", [])) + 1):
+            self.summarizer.schedule(state["session_id"])
         return {
             "history": [{
                 "user_message": state["user_message"],
@@ -89,37 +281,70 @@ class ChatNodes:
         }
     
     def decide_retrieval(self, state: ChatState):
-        """Uses the LLM to decide whether retrieval is needed."""
-        prompt = f"""
-        You are an AI assistant that determines whether a user's query requires retrieving external knowledge.
-
-        Rules:
-        1. If the query is a greeting or a general conversational question (e.g., "How are you?", "What's up?"), respond `False`.
-        2. If the query is related to legal issues, definitions, or specific knowledge (e.g., "What is the definition of negligence?", "Explain copyright law"), respond `True`.
-        3. If the query is ambiguous or lacks sufficient information, respond `True` to ensure accurate retrieval.
-        4. For all other cases, respond `True` if the query requires factual or specific knowledge, otherwise `False`.
-
-        Query: "{state['user_message']}"
-        Answer with 'True' if retrieval is needed, otherwise 'False'. It should be either of them in all cases.
-        """
-
-        response = self.generator.custom_call(prompt)  
-        state['requires_retrieval'] = "true" in response.lower().strip() 
-        return state
+        """Decides locally whether retrieval is needed, asking the LLM only when unsure."""
+        embedding = self._speculate(state) if self.speculative else None
+        return self._routed(state, self.router.route(state['user_message'], embedding))
+
+    # Async variants of the nodes, for the async workflow. Blocking work (routing,
+    # embedding and search, database reads) runs in worker threads; the LLM is awaited.
+    async def adecide_retrieval(self, state: ChatState):
+        embedding = self._speculate(state) if self.speculative else None
+        return self._routed(state, await asyncio.to_thread(self.router.route, state['user_message'], embedding))
+
+    async def aretrieve_documents(self, state: ChatState) -> Dict:
+        docs = await self._acollect(state, "retrieve", "retrieval_saved_ms")
+        if docs is None:
+            docs = await asyncio.to_thread(lambda: self.retriever.retrieve_documents(state["user_message"]))
+        return self._retrieved(docs)
+
+    async def agenerate_response(self, state: ChatState) -> Dict:
+        try:
+            conversation = (self._given_conversation(state) or
+                            await self._acollect(state, "history", "history_saved_ms") or
+                            await self.aload_history(state["session_id"]))
+        finally:
+            self.discard_speculation(state.get("run_id"))
+        context, history, prompt_tokens = self._prompt(state, conversation)
+        writer = get_stream_writer()
+        response = ""
+        async for token in self.generator.astream_response(
+            context=context,
+            history=history,
+            query=state["user_message"]
+        ):
+            response += token
+            writer({"token": token})
+        return self._generated(response, prompt_tokens, conversation)
+
+    async def asave_conversation(self, state: ChatState) -> Dict:
+        # save_chat only enqueues for the background writer, so it does not block the loop
+        return self.save_conversation(state)
 
-# LangGraph Workflow Setup with LLM Classification
-def create_workflow():
-    nodes = ChatNodes()
+# LangGraph Workflow Setup with Retrieval Routing
+def create_workflow(nodes: Optional[ChatNodes] = None, asynchronous: bool = False):
+    """Compile the chat graph; with asynchronous=True it uses the async nodes, for astream()."""
+    nodes = nodes or ChatNodes()
     workflow = StateGraph(ChatState)
+    # Each node call is recorded as a span of the turn's trace
+    if not TRACING_ENABLED:
+        traced = lambda name, node: node
+    else:
+        traced = resources.get_tracer().awrap if asynchronous else resources.get_tracer().wrap
 
-    workflow.add_node("decide_retrieval", nodes.decide_retrieval)  # LLM decides if retrieval is needed
-    workflow.add_node("retrieve", nodes.retrieve_documents)
-    workflow.add_node("generate", nodes.generate_response)
-    workflow.add_node("save", nodes.save_conversation)
+    if asynchronous:
+        decide, retrieve, generate, save = (nodes.adecide_retrieval, nodes.aretrieve_documents,
+                                            nodes.agenerate_response, nodes.asave_conversation)
+    else:
+        decide, retrieve, generate, save = (nodes.decide_retrieval, nodes.retrieve_documents,
+                                            nodes.generate_response, nodes.save_conversation)
+    workflow.add_node("decide_retrieval", traced("decide_retrieval", decide))  # Local router, LLM fallback when unsure
+    workflow.add_node("retrieve", traced("retrieve", retrieve))
+    workflow.add_node("generate", traced("generate", generate))
+    workflow.add_node("save", traced("save", save))
 
     workflow.set_entry_point("decide_retrieval")
 
-    # Conditional transition based on LLM decision
+    # Conditional transition based on routing decision
     workflow.add_conditional_edges(
         "decide_retrieval",
         lambda state: "retrieve" if state['requires_retrieval'] else "generate",
@@ -0,0 +1,185 @@
+import threading
+from typing import Callable, Dict, List
+
+from langchain_core.embeddings import Embeddings
+
+from .config import LLM_API_KEY, LLM_MODEL, WARMUP_RESOURCES
+
+# Shared Resource Registry
+# One embedder, retriever, LLM client, chat database, tracer, answer cache and corpus
+# watcher per process. Each is created on first use (or by warm_up in the background) and then shared.
+
+_instances: Dict[str, object] = {}
+_locks: Dict[str, threading.Lock] = {}
+_registry_lock = threading.Lock()
+_ready: Dict[str, threading.Event] = {}
+_errors: Dict[str, Exception] = {}
+
+
+def _event(name: str) -> threading.Event:
+    with _registry_lock:
+        return _ready.setdefault(name, threading.Event())
+
+
+def _get(name: str, factory: Callable[[], object]):
+    instance = _instances.get(name)
+    if instance is not None:
+        return instance
+    with _registry_lock:
+        lock = _locks.setdefault(name, threading.Lock())
+    with lock:
+        if name not in _instances:
+            try:
+                _instances[name] = factory()
+            except Exception as e:
+                # Wake up waiters with the failure; the next access tries again
+                _errors[name] = e
+                _event(name).set()
+                raise
+            _errors.pop(name, None)
+            _event(name).set()
+    return _instances[name]
+
+
+def _create_embeddings():
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings()
+
+
+def _create_retriever():
+    from .retriever import DocumentRetriever
+    return DocumentRetriever(embeddings=get_embeddings())
+
+
+def _create_llm():
+    from langchain_groq import ChatGroq
+    return ChatGroq(api_key=LLM_API_KEY, model=LLM_MODEL)
+
+
+def _create_database():
+    from .database import ChatDatabase
+    return ChatDatabase()
+
+
+def _create_tracer():
+    from .tracing import Tracer
+    return Tracer()
+
+
+def _create_answer_cache():
+    from .cache import AnswerCache
+    return AnswerCache(CachedQueryEmbeddings())
+
+
+def _create_watcher():
+    from .watcher import CorpusWatcher
+    return CorpusWatcher(get_retriever()).start()
+
+
+def get_embeddings():
+    return _get("embeddings", _create_embeddings)
+
+
+def get_retriever():
+    return _get("retriever", _create_retriever)
+
+
+def get_llm():
+    return _get("llm", _create_llm)
+
+
+def get_database():
+    return _get("database", _create_database)
+
+
+def get_tracer():
+    return _get("tracer", _create_tracer)
+
+
+def get_answer_cache():
+    return _get("answer_cache", _create_answer_cache)
+
+
+def get_watcher():
+    return _get("watcher", _create_watcher)
+
+
+FACTORIES = {
+    "embeddings": get_embeddings,
+    "retriever": get_retriever,
+    "llm": get_llm,
+    "database": get_database,
+    "tracer": get_tracer,
+    "answer_cache": get_answer_cache,
+    "watcher": get_watcher,
+}
+
+
+def override(**instances):
+    """Install ready-made resources, e.g. offline stand-ins for benchmarks."""
+    for name, instance in instances.items():
+        if name not in FACTORIES:
+            raise ValueError(f"Unknown resource: {name}")
+        _instances[name] = instance
+        _errors.pop(name, None)
+        _event(name).set()
+
+
+def reset():
+    """Forget all shared resources so the next access creates them again."""
+    with _registry_lock:
+        _instances.clear()
+        _ready.clear()
+        _errors.clear()
+
+
+def is_ready(name: str) -> bool:
+    return name in _instances
+
+
+def error(name: str):
+    """The exception raised by the last failed attempt to create a resource, if any."""
+    return _errors.get(name)
+
+
+def wait_ready(name: str, timeout: float = None) -> bool:
+    """Wait until a resource is created; raises RuntimeError if creating it failed."""
+    if not _event(name).wait(timeout):
+        return False
+    if name not in _instances and name in _errors:
+        raise RuntimeError(f"Loading {name} failed: {_errors[name]}") from _errors[name]
+    return True
+
+
+def warm_up(names: List[str] = WARMUP_RESOURCES, background: bool = True):
+    """Create resources ahead of first use, by default in a daemon thread."""
+    def load():
+        for name in names:
+            try:
+                FACTORIES[name]()
+            except Exception as e:
+                print(f"Warm-up of {name} failed: {e}")
+
+    if not background:
+        load()
+        return None
+    thread = threading.Thread(target=load, name="resource-warmup", daemon=True)
+    thread.start()
+    return thread
+
+
+class LazyEmbeddings(Embeddings):
+    """Embeddings proxy that loads the shared model on first use."""
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return get_embeddings().embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_embeddings().embed_query(text)
+
+
+class CachedQueryEmbeddings(LazyEmbeddings):
+    """LazyEmbeddings whose query embeddings go through the retriever's persistent cache."""
+
+    def embed_query(self, text: str) -> List[float]:
+        return get_retriever().embed_query(text)
@@ -1,18 +1,104 @@
 import os
-from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.vectorstores import Chroma
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from typing import List, Dict, Any
+import time
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Tuple
 import json
-from .config import PROCESSED_FOLDER, VECTOR_STORE_PATH, RETRIEVE_DOCS
+import hashlib
+import numpy as np
+from langchain_core.documents import Document
+from .config import (PROCESSED_FOLDER, VECTOR_STORE_PATH, VECTOR_BACKEND, RETRIEVE_DOCS,
+                     INGEST_ON_STARTUP, INGEST_WORKERS, EMBED_BATCH_SIZE,
+                     INGEST_RECORD_EVERY_FILES, INGEST_RECORD_EVERY_SECONDS,
+                     HYBRID_RETRIEVAL, RRF_K, FUSION_CANDIDATES,
+                     QUERY_CACHE_ENABLED, QUERY_CACHE_PATH, QUERY_CACHE_MEMORY_SIZE, QUERY_CACHE_DISK_SIZE)
+from .cache import PersistentLRUCache
+from .ingest import IngestionPipeline
+from .lexical import BM25Index
+from .vectorstore import VectorStore, open_vector_store
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int, rank_constant: int = RRF_K) -> List[str]:
+    """Fuse ranked ID lists: each list contributes 1 / (rank_constant + rank) per ID."""
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking, 1):
+            scores[chunk_id] += 1.0 / (rank_constant + rank)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+class ReadWriteLock:
+    """Any number of readers or one writer. A waiting writer holds back new readers."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._readers = 0
+        self._writing = False
+        self._waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._waiting_writers:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if not self._readers:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._waiting_writers += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._waiting_writers -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
+
 # Document Retrieval Layer
 class DocumentRetriever:
-    def __init__(self):
-        self.embeddings = HuggingFaceEmbeddings()
+    def __init__(self, embeddings=None, auto_ingest: bool = INGEST_ON_STARTUP):
+        if embeddings is None:
+            from langchain_huggingface import HuggingFaceEmbeddings
+            embeddings = HuggingFaceEmbeddings()
+        self.embeddings = embeddings
+        # Queries read under the lock; each ingestion batch is written under it, so
+        # retrieval always sees whole batches and a corpus version matching them
+        self._lock = ReadWriteLock()
+        self._ingest_lock = threading.Lock()
+        self._uncommitted_batches = 0   # Batches stored since a file was last recorded
+        self.status = {"state": "idle", "files_total": 0, "files_done": 0, "last_ingest": None, "last_error": None}
         self.processed_files_path = os.path.join(VECTOR_STORE_PATH, "processed_files.json")
         self.processed_files = self._load_processed_files()
-        self.db = self._initialize_vectorstore()
+        self.store = self._open_vectorstore()
+        if self.processed_files and not self.store.count():
+            # E.g. VECTOR_BACKEND changed: the new store is empty, so every file is ingested again
+            print("Vector store is empty; re-ingesting all processed files")
+            self.processed_files = {}
+        self._refresh_version()
+        self.lexical = BM25Index() if HYBRID_RETRIEVAL else None
+        self.embedding_cache = self.result_cache = None
+        if QUERY_CACHE_ENABLED:
+            # Level 1: normalized query -> embedding. Level 2: (corpus version, k, query) -> ranked chunk IDs
+            self.embedding_cache = PersistentLRUCache(QUERY_CACHE_PATH, "query_embeddings",
+                                                      QUERY_CACHE_MEMORY_SIZE, QUERY_CACHE_DISK_SIZE)
+            self.result_cache = PersistentLRUCache(QUERY_CACHE_PATH, "retrieval_results",
+                                                   QUERY_CACHE_MEMORY_SIZE, QUERY_CACHE_DISK_SIZE)
+        if self.lexical is not None and not len(self.lexical):
+            self._backfill_lexical()
+        if auto_ingest:
+            self.ingest()
 
     def _load_processed_files(self) -> Dict[str, Dict]:
         """Load the list of processed files and their metadata."""
@@ -22,10 +108,43 @@ class DocumentRetriever:
         return {}
 
     def _save_processed_files(self):
-        """Save the list of processed files and their metadata."""
+        """Save the list of processed files and their metadata.
+
+        Written to a temporary file and renamed, so a crash never leaves a truncated record.
+        """
         os.makedirs(VECTOR_STORE_PATH, exist_ok=True)
-        with open(self.processed_files_path, 'w') as f:
+        tmp_path = self.processed_files_path + ".tmp"
+        with open(tmp_path, 'w') as f:
             json.dump(self.processed_files, f, indent=2)
+        os.replace(tmp_path, self.processed_files_path)
+
+    def _refresh_version(self):
+        """Recompute corpus_version; called under the write lock whenever the corpus changes."""
+        record = json.dumps({name: meta.get("sha256", meta.get("mtime"))
+                             for name, meta in self.processed_files.items()}, sort_keys=True)
+        version = hashlib.sha256(record.encode()).hexdigest()[:16]
+        self._corpus_version = f"{version}+{self._uncommitted_batches}" if self._uncommitted_batches else version
+
+    @property
+    def corpus_version(self) -> str:
+        """Short hash of the processed files' contents; changes whenever the corpus does.
+
+        While a file is being ingested, every stored batch moves the version on too
+        ("<hash>+<batches>").
+        """
+        return self._corpus_version
+
+    def ingest_status(self) -> Dict[str, Any]:
+        """Ingestion state ("idle" or "ingesting"), progress, last run and corpus version."""
+        return {**self.status, "corpus_version": self.corpus_version}
+
+    @contextmanager
+    def _committing(self):
+        """Write lock for one ingestion batch."""
+        with self._lock.write():
+            yield
+            self._uncommitted_batches += 1
+            self._refresh_version()
 
     def _get_file_metadata(self, filepath: str) -> Dict:
         """Get file metadata including modification time and size."""
@@ -35,66 +154,264 @@ class DocumentRetriever:
             "size": stat.st_size
         }
 
-    def _has_file_changed(self, filepath: str) -> bool:
-        """Check if a file has been modified since last processing."""
+    def _file_hash(self, filepath: str) -> str:
+        """SHA-256 of the file contents."""
+        digest = hashlib.sha256()
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def _changed_file_record(self, filepath: str) -> Optional[Dict]:
+        """Metadata and content hash of a file that is new or changed since last processing, else None.
+
+        The file is hashed at most once per run; the result is what gets recorded
+        once the file is ingested.
+        """
         if not os.path.exists(filepath):
-            return False
+            return None
 
+        # mtime and size are a cheap pre-check; the content hash decides
         current_metadata = self._get_file_metadata(filepath)
-        filename = os.path.basename(filepath)
+        stored_metadata = self.processed_files.get(os.path.basename(filepath))
+        if stored_metadata is not None and (current_metadata["mtime"] == stored_metadata["mtime"] and
+                                            current_metadata["size"] == stored_metadata["size"]):
+            return None
+        digest = self._file_hash(filepath)
+        if stored_metadata is not None and stored_metadata.get("sha256") == digest:
+            # Touched but not modified: refresh mtime so the file is not hashed again
+            stored_metadata.update(current_metadata)
+            return None
+        return {**current_metadata, "sha256": digest}
+
+    def _open_vectorstore(self) -> VectorStore:
+        """Open the persisted VECTOR_BACKEND store, creating it if it does not exist yet."""
+        return open_vector_store(VECTOR_BACKEND, self.embeddings)
+
+    def _backfill_lexical(self, page_size: int = 1000):
+        """Build the lexical index from chunks already in the vector store."""
+        total = self.store.count()
+        if total:
+            print(f"Building lexical index for {total} existing chunks")
+        for ids, texts, metadatas in self.store.iter_chunks(page_size):
+            self.lexical.add(ids, texts, metadatas)
+
+    def _stored_ids(self, filepath: str) -> List[str]:
+        """IDs of a file's chunks already in the vector store."""
+        return self.store.ids_for_source(filepath)
+
+    def _delete_ids(self, ids: List[str]):
+        if ids:
+            self.store.delete(ids)
+            if self.lexical is not None:
+                self.lexical.delete(ids)
 
-        if filename not in self.processed_files:
-            return True
+    def _delete_source(self, filepath: str):
+        """Delete every chunk of a file, for files indexed before chunk IDs were tracked."""
+        self._delete_ids(self._stored_ids(filepath))
 
-        stored_metadata = self.processed_files[filename]
-        return (current_metadata["mtime"] != stored_metadata["mtime"] or
-                current_metadata["size"] != stored_metadata["size"])
+    def ingest(self, workers: int = INGEST_WORKERS, batch_size: int = EMBED_BATCH_SIZE) -> Dict[str, Any]:
+        """Sync the vector store with the PDFs in the processed folder.
 
-    def _initialize_vectorstore(self):
-        """Initialize or update the vector store with new or modified documents."""
+        Only new or changed chunks of modified files are embedded; chunks that no
+        longer exist and all chunks of deleted files are removed from the index.
+        Each file is recorded as processed as soon as all its chunks are stored,
+        and the record is saved every INGEST_RECORD_EVERY_FILES files. An
+        interrupted run resumes with the files it had not saved as finished,
+        and chunks it had already stored for them are not embedded again.
+        """
+        with self._ingest_lock:
+            self.status.update(state="ingesting", files_total=0, files_done=0)
+            started = time.time()
+            try:
+                stats = self._ingest(workers, batch_size)
+            except Exception as e:
+                self.status["last_error"] = repr(e)
+                raise
+            finally:
+                self.status["state"] = "idle"
+            self.status["last_ingest"] = {"finished_at": time.time(), "seconds": time.time() - started,
+                                          **{key: stats[key] for key in ("files", "removed_files", "chunks",
+                                                                          "deleted_chunks", "failed_files")}}
+            self.status["last_error"] = None
+            return stats
+
+    def _ingest(self, workers: int, batch_size: int) -> Dict[str, Any]:
         if not os.path.exists(PROCESSED_FOLDER):
             os.makedirs(PROCESSED_FOLDER)
 
-        # Get all PDF files in the processed folder
-        pdf_files = [f for f in os.listdir(PROCESSED_FOLDER) if f.endswith(".pdf")]
-        
-        # Check for new or modified files
-        new_docs = []
-        for filename in pdf_files:
-            filepath = os.path.join(PROCESSED_FOLDER, filename)
-            
-            if self._has_file_changed(filepath):
-                print(f"Processing new/modified file: {filename}")
-                loader = PyPDFLoader(filepath)
-                new_docs.extend(loader.load())
-                
-                # Update processed files record
-                self.processed_files[filename] = self._get_file_metadata(filepath)
-        
-        # Save the updated processed files record
-        self._save_processed_files()
-
-        # If we have new documents, process them and update the vector store
-        if new_docs:
-            print(f"Number of new documents to process: {len(new_docs)}")
-            text_splitter = RecursiveCharacterTextSplitter(chunk_size=1500, chunk_overlap=300)
-            texts = text_splitter.split_documents(new_docs)
-            print(f"Created {len(texts)} chunks from new documents")
-            
-            # If vector store exists, add to it; otherwise create new
-            if os.path.exists(VECTOR_STORE_PATH):
-                db = Chroma(persist_directory=VECTOR_STORE_PATH, 
-                          embedding_function=self.embeddings)
-                db.add_documents(texts)
-                return db
-            else:
-                return Chroma.from_documents(texts, self.embeddings, 
-                                          persist_directory=VECTOR_STORE_PATH)
-        
-        # If no new documents, just load existing vector store
-        return Chroma(persist_directory=VECTOR_STORE_PATH, 
-                     embedding_function=self.embeddings)
-
-    def retrieve_documents(self, query: str, k=RETRIEVE_DOCS) -> List[Any]:
-        """Retrieve similar documents for a given query."""
-        return self.db.similarity_search(query, k)
\ No newline at end of file
+        pdf_files = sorted(f for f in os.listdir(PROCESSED_FOLDER) if f.endswith(".pdf"))
+        changed = {}
+        for f in pdf_files:
+            filepath = os.path.join(PROCESSED_FOLDER, f)
+            file_record = self._changed_file_record(filepath)
+            if file_record is not None:
+                changed[filepath] = file_record
+        changed_files = list(changed)
+        removed_files = [name for name in self.processed_files if name not in pdf_files]
+
+        # The record holds every file's chunk IDs, so it is saved every few files rather than after each;
+        # files stored since the last save are found again by their chunk IDs in the vector store
+        deleted_chunks, unsaved, saved_at = 0, 0, time.monotonic()
+
+        def recorded():
+            nonlocal unsaved, saved_at
+            unsaved += 1
+            if unsaved >= INGEST_RECORD_EVERY_FILES or time.monotonic() - saved_at >= INGEST_RECORD_EVERY_SECONDS:
+                self._save_processed_files()
+                unsaved, saved_at = 0, time.monotonic()
+
+        stats = {"files": 0, "pages": 0, "chunks": 0, "unchanged_chunks": 0, "failed_files": 0}
+        self.status["files_total"] = len(changed_files)
+        try:
+            for name in removed_files:
+                print(f"Removing deleted file: {name}")
+                deleted_chunks += self._forget_file(name)
+                recorded()
+
+            if changed_files:
+                print(f"Processing {len(changed_files)} new/modified files")
+                existing_ids = {}
+                for filepath in changed_files:
+                    record = self.processed_files.get(os.path.basename(filepath))
+                    if record and "chunk_ids" not in record:
+                        # Indexed before chunk IDs were tracked: drop its chunks and re-embed
+                        with self._lock.write():
+                            self._delete_source(filepath)
+                    # Chunks stored by an interrupted run count as existing too
+                    existing_ids[filepath] = set(record.get("chunk_ids", [])) if record else set()
+                    existing_ids[filepath].update(self._stored_ids(filepath))
+
+                def record_file(filepath: str, chunk_ids: List[str]):
+                    nonlocal deleted_chunks
+                    stale_ids = list(existing_ids[filepath] - set(chunk_ids))
+                    record = {**changed[filepath], "chunk_ids": chunk_ids}
+                    with self._lock.write():
+                        self._delete_ids(stale_ids)
+                        self.processed_files[os.path.basename(filepath)] = record
+                        self._uncommitted_batches = 0
+                        self._refresh_version()
+                    recorded()
+                    deleted_chunks += len(stale_ids)
+                    self.status["files_done"] += 1
+
+                pipeline = IngestionPipeline(self.embeddings, self.store, workers=workers, batch_size=batch_size,
+                                             lexical=self.lexical, store_lock=self._committing)
+                stats = pipeline.run(changed_files, existing_ids=existing_ids, on_file=record_file)
+        finally:
+            # Also persists refreshed mtimes of touched-but-unchanged files
+            self._save_processed_files()
+
+        if self.lexical is not None and self.lexical.needs_compaction():
+            self.lexical.compact()
+        stats["removed_files"] = len(removed_files)
+        stats["deleted_chunks"] = deleted_chunks
+        if self.result_cache is not None and (changed_files or removed_files):
+            # Keys carry the corpus version already; clearing just frees the space early
+            self.result_cache.clear()
+        return stats
+
+    def _forget_file(self, filename: str) -> int:
+        """Delete a removed file's chunks, then drop it from the processed record; returns the chunks deleted."""
+        record = self.processed_files[filename]
+        if "chunk_ids" in record:
+            ids = record["chunk_ids"]
+        else:
+            ids = self._stored_ids(os.path.join(PROCESSED_FOLDER, filename))
+        with self._lock.write():
+            self._delete_ids(ids)
+            del self.processed_files[filename]
+            self._refresh_version()
+        return len(ids)
+
+    @staticmethod
+    def _normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def embed_query(self, query: str) -> List[float]:
+        """Embed a query, reusing the cached embedding of the same normalized text."""
+        normalized = self._normalize_query(query)
+        if self.embedding_cache is None:
+            return self.embeddings.embed_query(normalized)
+
+        # Keyed by model too, so switching embedding models never returns stale vectors
+        key = f"{getattr(self.embeddings, 'model_name', type(self.embeddings).__name__)}:{normalized}"
+        cached = self.embedding_cache.get(key)
+        if cached is not None:
+            return np.frombuffer(cached, dtype=np.float32).tolist()
+        start = time.perf_counter()
+        vector = self.embeddings.embed_query(normalized)
+        self.embedding_cache.put(key, np.asarray(vector, dtype=np.float32).tobytes(),
+                                 (time.perf_counter() - start) * 1000)
+        return vector
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Hit rates and milliseconds saved by the query embedding and result caches."""
+        if self.embedding_cache is None:
+            return {}
+        return {"embeddings": self.embedding_cache.stats(), "results": self.result_cache.stats()}
+
+    def _get_documents(self, ids: List[str]) -> List[Document]:
+        """Fetch chunks by ID, in the given order."""
+        if not ids:
+            return []
+        documents = {
+            chunk_id: Document(page_content=text, metadata=metadata)
+            for chunk_id, text, metadata in self.store.get(ids)
+        }
+        return [documents[chunk_id] for chunk_id in ids if chunk_id in documents]
+
+    def _vector_search(self, query_vector: List[float], k: int) -> List[Tuple[str, Document]]:
+        """Similarity search returning (chunk_id, document) pairs."""
+        return [
+            (chunk_id, Document(page_content=text, metadata=metadata))
+            for chunk_id, text, metadata in self.store.search([query_vector], k)[0]
+        ]
+
+    def _rank(self, query: str, query_vector: List[float], k: int) -> List[Tuple[str, Document]]:
+        """Top-k (chunk_id, document) pairs, fusing vector and BM25 rankings when hybrid."""
+        if self.lexical is None or not len(self.lexical):
+            return self._vector_search(query_vector, k)
+
+        candidates = k * FUSION_CANDIDATES
+        vector_hits = self._vector_search(query_vector, candidates)
+        lexical_hits = self.lexical.search(query, candidates)
+        ranked = reciprocal_rank_fusion(
+            [[chunk_id for chunk_id, _ in vector_hits], [chunk_id for chunk_id, _ in lexical_hits]], k
+        )
+        documents = dict(vector_hits)
+        documents.update(self.lexical.get_documents([i for i in ranked if i not in documents]))
+        return [(chunk_id, documents[chunk_id]) for chunk_id in ranked if chunk_id in documents]
+
+    def _result_key(self, query_hash: str, k: int) -> str:
+        return f"{self.corpus_version}:{k}:{int(self.lexical is not None)}:{query_hash}"
+
+    def retrieve_documents(self, query: str, k=RETRIEVE_DOCS,
+                           embedding: Optional[Callable[[], List[float]]] = None) -> List[Any]:
+        """Retrieve similar documents for a given query.
+
+        With hybrid retrieval, vector and BM25 candidates are merged by reciprocal
+        rank fusion so exact statute and section matches are not missed. Ranked
+        chunk IDs are cached per corpus version, so repeated queries skip both
+        the embedding and the search. Searches run under the read lock, so
+        they see the corpus either before or after an ingestion batch, never
+        halfway through one. embedding, if given, returns the query's embedding
+        and is used instead of embed_query.
+        """
+        query_hash = hashlib.sha1(self._normalize_query(query).encode()).hexdigest()
+        if self.result_cache is not None:
+            with self._lock.read():
+                cached = self.result_cache.get(self._result_key(query_hash, k))
+                if cached is not None:
+                    return self._get_documents(json.loads(cached))
+
+        # Embed outside the lock so a waiting ingestion batch is not held up by the model
+        start = time.perf_counter()
+        query_vector = embedding() if embedding else self.embed_query(query)
+        with self._lock.read():
+            ranked = self._rank(query, query_vector, k)
+            if self.result_cache is not None:
+                self.result_cache.put(self._result_key(query_hash, k),
+                                      json.dumps([chunk_id for chunk_id, _ in ranked]).encode(),
+                                      (time.perf_counter() - start) * 1000)
+        return [doc for _, doc in ranked]
@@ -0,0 +1,74 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+from .config import RAW_HISTORY_TURNS, SUMMARY_TRIGGER_TURNS, SUMMARY_MAX_WORDS
+
+
+# Rolling Conversation Summaries
+class ConversationSummarizer:
+    """Folds older turns of a session into a running summary stored in the sessions table.
+
+    Updates run on a single background thread after a turn is saved, and only
+    once a session has more than SUMMARY_TRIGGER_TURNS turns that the summary
+    does not cover yet. The RAW_HISTORY_TURNS most recent turns stay verbatim.
+    """
+
+    def __init__(self, generator, db, trigger_turns: int = SUMMARY_TRIGGER_TURNS,
+                 raw_turns: int = RAW_HISTORY_TURNS, max_words: int = SUMMARY_MAX_WORDS):
+        self.generator = generator
+        self.db = db
+        self.trigger_turns = trigger_turns
+        self.raw_turns = raw_turns
+        self.max_words = max_words
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+        self._pending = set()
+        self._lock = threading.Lock()
+
+    def needs_update(self, unsummarized_turns: int) -> bool:
+        return unsummarized_turns > self.trigger_turns
+
+    def schedule(self, session_id: str):
+        """Queue a summary update unless one is already waiting for this session."""
+        with self._lock:
+            if session_id in self._pending:
+                return None
+            self._pending.add(session_id)
+        return self._executor.submit(self._run, session_id)
+
+    def _run(self, session_id: str):
+        with self._lock:
+            self._pending.discard(session_id)
+        try:
+            self.update(session_id)
+        except Exception as e:
+            print(f"Summary update for session {session_id} failed: {e}")
+
+    def _prompt(self, summary: str, turns: List[Dict]) -> str:
+        conversation = "\n".join(f"User: {turn['user_message']}\nBot: {turn['response']}" for turn in turns)
+        return f"""
+        You maintain a running summary of a legal consultation between a user and an assistant.
+        Update the summary with the new exchanges below. Keep the facts of the user's situation,
+        the legal questions asked, the laws, sections and cases referred to, and any conclusions or advice given.
+        Drop greetings and small talk. Write at most {self.max_words} words of plain prose.
+
+        Current summary:
+        {summary or "(none)"}
+
+        New exchanges:
+        {conversation}
+
+        Updated summary:
+        """
+
+    def update(self, session_id: str) -> bool:
+        """Fold overflowing turns into the session summary. Returns True if it changed."""
+        current = self.db.get_summary(session_id)
+        # Newest first: everything past the raw window is folded in, oldest first
+        turns = self.db.get_chat_history(session_id, limit=-1, after_id=current['summarized_until'])
+        if not self.needs_update(len(turns)):
+            return False
+        folded = list(reversed(turns[self.raw_turns:]))
+        summary = self.generator.custom_call(self._prompt(current['summary'], folded)).strip()
+        self.db.update_summary(session_id, summary, folded[-1]['chat_id'])
+        return True
@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+import contextvars
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List
+
+from .config import TRACE_DB_PATH, TRACE_WINDOW, TRACE_MAX_SPANS, DB_WRITE_BATCH
+from .database import WriteBehindQueue
+
+# Attributes of the span currently running in this thread/context
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def annotate(**attributes):
+    """Attach attributes (token counts, hit counts, ...) to the span that is running."""
+    span = _current_span.get()
+    if span is not None:
+        span.update(attributes)
+
+
+def _percentile(ordered: List[float], pct: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+# Workflow Tracing
+class Tracer:
+    """Records timing spans per workflow node and per chat turn.
+
+    Spans are written to a local SQLite table through a background writer and
+    the table is capped at TRACE_MAX_SPANS rows. Rolling p50/p95/p99 over the
+    last TRACE_WINDOW spans of each name are kept in memory.
+    """
+
+    def __init__(self, path: str = TRACE_DB_PATH, window: int = TRACE_WINDOW, max_spans: int = TRACE_MAX_SPANS):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.max_spans = max_spans
+        conn = sqlite3.connect(path)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS spans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                trace_id TEXT,
+                name TEXT,
+                started_at TEXT,
+                duration_ms REAL,
+                attributes TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_spans_trace_id ON spans (trace_id)")
+        conn.close()
+        self._writer = WriteBehindQueue(path, DB_WRITE_BATCH)
+        self._durations: Dict[str, deque] = defaultdict(lambda: deque(maxlen=window))
+        self._lock = threading.Lock()
+        self._recorded = 0
+
+    def record(self, trace_id: str, name: str, duration_ms: float, attributes: Dict[str, Any] = None,
+               started_at: float = None):
+        """Record a finished span; started_at is its wall-clock start (time.time()), by default
+        derived from the duration."""
+        if started_at is None:
+            started_at = time.time() - duration_ms / 1000
+        with self._lock:
+            self._durations[name].append(duration_ms)
+            self._recorded += 1
+            prune = self._recorded % 1000 == 0
+        self._writer.submit("""
+            INSERT INTO spans (trace_id, name, started_at, duration_ms, attributes) VALUES (?, ?, ?, ?, ?)
+        """, (trace_id, name, datetime.fromtimestamp(started_at, timezone.utc).isoformat(timespec="milliseconds"),
+              duration_ms, json.dumps(attributes or {})))
+        if prune:
+            self._writer.submit("DELETE FROM spans WHERE id <= (SELECT MAX(id) FROM spans) - ?", (self.max_spans,))
+
+    @contextmanager
+    def span(self, trace_id: str, name: str, **attributes):
+        """Time a block; annotate() inside it adds attributes to this span."""
+        token = _current_span.set(attributes)
+        started_at, start = time.time(), time.perf_counter()
+        try:
+            yield attributes
+        finally:
+            _current_span.reset(token)
+            self.record(trace_id, name, (time.perf_counter() - start) * 1000, attributes, started_at)
+
+    def wrap(self, name: str, node: Callable[[Dict], Any]) -> Callable[[Dict], Any]:
+        """Wrap a LangGraph node so every call is recorded under the state's trace_id."""
+        def traced(state):
+            with self.span(state.get("trace_id"), name):
+                return node(state)
+        traced.__name__ = getattr(node, "__name__", name)
+        return traced
+
+    def awrap(self, name: str, node: Callable[[Dict], Any]) -> Callable[[Dict], Any]:
+        """Async version of wrap, for coroutine nodes."""
+        async def traced(state):
+            with self.span(state.get("trace_id"), name):
+                return await node(state)
+        traced.__name__ = getattr(node, "__name__", name)
+        return traced
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Rolling latency percentiles per span name, in milliseconds."""
+        with self._lock:
+            snapshot = {name: sorted(durations) for name, durations in self._durations.items() if durations}
+        return {
+            name: {"count": len(ordered), "p50": _percentile(ordered, 50),
+                   "p95": _percentile(ordered, 95), "p99": _percentile(ordered, 99)}
+            for name, ordered in snapshot.items()
+        }
+
+    def get_trace(self, trace_id: str) -> List[Dict]:
+        """All recorded spans of one turn, in the order they finished."""
+        self._writer.flush()
+        conn = sqlite3.connect(self.path)
+        try:
+            rows = conn.execute("""
+                SELECT name, started_at, duration_ms, attributes FROM spans WHERE trace_id = ? ORDER BY id
+            """, (trace_id,)).fetchall()
+        finally:
+            conn.close()
+        return [
+            {"name": name, "started_at": started_at, "duration_ms": duration_ms, **json.loads(attributes)}
+            for name, started_at, duration_ms, attributes in rows
+        ]
@@ -0,0 +1,508 @@
+import os
+import abc
+import json
+import sqlite3
+import threading
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .config import (VECTOR_BACKEND, VECTOR_STORE_PATH, MMAP_INDEX_PATH, MMAP_VECTOR_DTYPE, MMAP_IVF_LISTS,
+                     MMAP_IVF_PROBES)
+
+SEARCH_BLOCK_ROWS = 8192   # Rows scored per matrix product in exact search
+IVF_TRAIN_FACTOR = 39      # Live vectors per list needed before the coarse index is trained
+IVF_RETRAIN_GROWTH = 4     # Retrain once the index holds this many times the vectors it was trained on
+IVF_SAMPLE_FACTOR = 256    # Training sample size per list
+IVF_ITERATIONS = 10
+SQLITE_MAX_VARIABLES = 900
+
+Chunk = Tuple[str, str, Dict]   # (chunk_id, text, metadata)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def _batches(items: Sequence, size: int = SQLITE_MAX_VARIABLES) -> Iterator[Sequence]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _last_occurrences(ids: Sequence[str]) -> List[int]:
+    """Positions of the last occurrence of each ID, in order, so a repeated ID's last version wins."""
+    last = {chunk_id: i for i, chunk_id in enumerate(ids)}
+    return sorted(last.values())
+
+
+def _decode(vectors: np.ndarray, scales: Optional[np.ndarray], rows) -> np.ndarray:
+    """Stored vectors of the given rows (a slice or an index array) as float32."""
+    decoded = np.asarray(vectors[rows], dtype=np.float32)
+    if scales is not None:
+        decoded *= np.asarray(scales[rows])[:, None]
+    return decoded
+
+
+class _View(NamedTuple):
+    """The arrays a search reads, taken under the lock so a concurrent write cannot swap them midway."""
+    vectors: np.ndarray
+    scales: Optional[np.ndarray]
+    alive: np.ndarray
+    centroids: Optional[np.ndarray]
+    lists: Optional[List[np.ndarray]]
+
+
+# Vector Store Backends
+class VectorStore(abc.ABC):
+    """Chunk embeddings with their text and metadata, searchable by similarity.
+
+    DocumentRetriever and IngestionPipeline only use these methods, so backends
+    can be swapped with VECTOR_BACKEND.
+    """
+
+    @abc.abstractmethod
+    def count(self) -> int:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]], documents: List[str], metadatas: List[Dict]):
+        """Add chunks; chunks with an existing ID are replaced, and an ID repeated in ids keeps its last version."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def get(self, ids: List[str]) -> List[Chunk]:
+        """The chunks with the given IDs that exist, in any order."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def ids_for_source(self, source: str) -> List[str]:
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def iter_chunks(self, page_size: int = 1000) -> Iterator[Tuple[List[str], List[str], List[Dict]]]:
+        """All chunks as (ids, texts, metadatas) pages."""
+        raise NotImplementedError
+
+    @abc.abstractmethod
+    def search(self, query_vectors: List[List[float]], k: int) -> List[List[Chunk]]:
+        """Top-k chunks for each query vector, most similar first."""
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """The persisted Chroma collection, through LangChain's wrapper."""
+
+    def __init__(self, embeddings, path: str = VECTOR_STORE_PATH):
+        from langchain.vectorstores import Chroma
+        self.db = Chroma(persist_directory=path, embedding_function=embeddings)
+        self._collection = self.db._collection
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        keep = _last_occurrences(ids)
+        if len(keep) < len(ids):
+            # Chroma rejects an upsert that repeats an ID
+            ids, embeddings, documents, metadatas = ([values[i] for i in keep]
+                                                     for values in (ids, embeddings, documents, metadatas))
+        self._collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        if ids:
+            self.db.delete(ids=ids)
+
+    def get(self, ids):
+        if not ids:
+            return []
+        found = self._collection.get(ids=ids, include=["documents", "metadatas"])
+        return [(chunk_id, text, metadata or {})
+                for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])]
+
+    def ids_for_source(self, source):
+        return self._collection.get(where={"source": source}, include=[])["ids"]
+
+    def iter_chunks(self, page_size=1000):
+        for offset in range(0, self.count(), page_size):
+            page = self._collection.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+            yield page["ids"], page["documents"], page["metadatas"]
+
+    def search(self, query_vectors, k):
+        results = self._collection.query(
+            query_embeddings=[list(map(float, vector)) for vector in query_vectors],
+            n_results=k,
+            include=["documents", "metadatas"]
+        )
+        return [
+            [(chunk_id, text, metadata or {}) for chunk_id, text, metadata in zip(ids, texts, metadatas)]
+            for ids, texts, metadatas in zip(results["ids"], results["documents"], results["metadatas"])
+        ]
+
+
+class MmapVectorStore(VectorStore):
+    """In-process vector index over a memory-mapped array.
+
+    Embeddings are L2-normalized and stored as one contiguous float16 or int8
+    array (int8 with a float32 scale per row) in vectors.bin, which every
+    process opening the index maps into the same page cache. Chunk text,
+    metadata and the row of each chunk live in a SQLite side store
+    (chunks.db); a generation counter there tells other processes to reload
+    after a write. Rows of deleted chunks are reused.
+
+    Search is exact cosine similarity over blocks of rows, for a batch of
+    queries at once. With ivf_lists set, a coarse index of that many k-means
+    centroids is trained once the index holds ivf_lists * IVF_TRAIN_FACTOR
+    vectors, and queries only score the rows of their `probes` nearest lists.
+    It is retrained when the index has grown IVF_RETRAIN_GROWTH times past
+    that, so centroids learned from the first files keep fitting the corpus.
+    """
+
+    def __init__(self, path: str = MMAP_INDEX_PATH, dtype: str = MMAP_VECTOR_DTYPE, ivf_lists: int = MMAP_IVF_LISTS,
+                 probes: int = MMAP_IVF_PROBES):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.ivf_lists = ivf_lists
+        self.probes = probes
+        self._lock = threading.RLock()
+        self._readers = threading.local()
+        # Autocommit mode: writes open their own BEGIN IMMEDIATE transaction, which also serializes
+        # writers in different processes
+        self.conn = sqlite3.connect(os.path.join(path, "chunks.db"), check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS chunks (
+                row INTEGER PRIMARY KEY,
+                chunk_id TEXT UNIQUE NOT NULL,
+                source TEXT,
+                document TEXT,
+                metadata TEXT,
+                list INTEGER
+            )
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_chunks_source ON chunks (source)")
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('dtype', ?)", (dtype,))
+        self.dtype = self._meta("dtype")
+        if self.dtype != dtype:
+            print(f"Vector index at {path} stores {self.dtype}; ignoring dtype={dtype}")
+        self._load()
+
+    def _meta(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def _set_meta(self, **values):
+        self.conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                              [(key, str(value)) for key, value in values.items()])
+
+    def _load(self):
+        """(Re)open the arrays and rebuild the in-memory row state from the side store."""
+        self._generation = int(self._meta("generation", 0))
+        self.dimensions = int(self._meta("dimensions", 0)) or None
+        self.capacity = int(self._meta("capacity", 0))
+        self.size = int(self._meta("size", 0))   # Rows ever used; rows of deleted chunks are free
+        self.vectors = self.scales = None
+        if self.dimensions and self.capacity:
+            self.vectors = np.memmap(os.path.join(self.path, "vectors.bin"), dtype=self.dtype, mode="r+",
+                                     shape=(self.capacity, self.dimensions))
+            if self.dtype == "int8":
+                self.scales = np.memmap(os.path.join(self.path, "scales.bin"), dtype=np.float32, mode="r+",
+                                        shape=(self.capacity,))
+        rows = self.conn.execute("SELECT row, list FROM chunks").fetchall()
+        self._alive = np.zeros(self.capacity, dtype=bool)
+        self._assignments = np.full(self.capacity, -1, dtype=np.int32)
+        if rows:
+            rows = np.asarray(rows, dtype=np.int64)
+            self._alive[rows[:, 0]] = True
+            self._assignments[rows[:, 0]] = rows[:, 1]
+        centroids_path = os.path.join(self.path, "centroids.npy")
+        self.centroids = np.load(centroids_path) if self._meta("ivf_trained") and os.path.exists(centroids_path) \
+            else None
+        self._lists: Optional[List[np.ndarray]] = None
+
+    def _refresh(self):
+        """Reload if another process has written since this one last looked."""
+        if int(self._meta("generation", 0)) != self._generation:
+            self._load()
+
+    def _commit_write(self):
+        self._generation += 1
+        self._set_meta(generation=self._generation, size=self.size, capacity=self.capacity)
+        if self.vectors is not None:
+            self.vectors.flush()
+            if self.scales is not None:
+                self.scales.flush()
+        self.conn.execute("COMMIT")
+
+    def _grow(self, rows: int):
+        """Make room for at least `rows` rows by extending the files and remapping them."""
+        if rows <= self.capacity:
+            return
+        capacity = max(rows, 2 * self.capacity, 1024)
+        for name, itemsize in (("vectors.bin", np.dtype(self.dtype).itemsize * self.dimensions),
+                               ("scales.bin", 4 if self.dtype == "int8" else 0)):
+            if itemsize:
+                with open(os.path.join(self.path, name), "ab") as f:
+                    f.truncate(capacity * itemsize)
+        self.capacity = capacity
+        self.vectors = np.memmap(os.path.join(self.path, "vectors.bin"), dtype=self.dtype, mode="r+",
+                                 shape=(capacity, self.dimensions))
+        if self.dtype == "int8":
+            self.scales = np.memmap(os.path.join(self.path, "scales.bin"), dtype=np.float32, mode="r+",
+                                    shape=(capacity,))
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - len(self._alive), dtype=bool)])
+        self._assignments = np.concatenate([self._assignments,
+                                            np.full(capacity - len(self._assignments), -1, dtype=np.int32)])
+
+    def _store_vectors(self, rows: np.ndarray, vectors: np.ndarray):
+        if self.dtype == "float16":
+            self.vectors[rows] = vectors.astype(np.float16)
+        else:
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1.0
+            self.vectors[rows] = np.round(vectors / scales[:, None]).astype(np.int8)
+            self.scales[rows] = scales
+
+    def _decode(self, rows) -> np.ndarray:
+        return _decode(self.vectors, self.scales, rows)
+
+    def _reader(self) -> sqlite3.Connection:
+        """Per-thread connection for side-store reads, so searches do not queue behind each other."""
+        conn = getattr(self._readers, "conn", None)
+        if conn is None:
+            conn = self._readers.conn = sqlite3.connect(os.path.join(self.path, "chunks.db"))
+        return conn
+
+    def _rows_of(self, ids: Sequence[str]) -> Dict[str, int]:
+        found = {}
+        for batch in _batches(list(ids)):
+            found.update(self.conn.execute(
+                f"SELECT chunk_id, row FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})", batch
+            ).fetchall())
+        return found
+
+    def count(self) -> int:
+        with self._lock:
+            self._refresh()
+            return int(self._alive.sum())
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if not ids:
+            return
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        keep = _last_occurrences(ids)
+        if len(keep) < len(ids):
+            # One row per ID: a repeated ID would otherwise take a row for each occurrence
+            ids, documents, metadatas = ([values[i] for i in keep] for values in (ids, documents, metadatas))
+            vectors = vectors[keep]
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                if self.dimensions is None:
+                    self.dimensions = vectors.shape[1]
+                    self._set_meta(dimensions=self.dimensions)
+                elif vectors.shape[1] != self.dimensions:
+                    raise ValueError(f"Expected {self.dimensions}-dimensional embeddings, got {vectors.shape[1]}")
+
+                existing = self._rows_of(ids)
+                free = iter(np.flatnonzero(~self._alive[:self.size]).tolist())
+                rows = []
+                for chunk_id in ids:
+                    row = existing.get(chunk_id)
+                    if row is None:
+                        row = next(free, None)
+                        if row is None:
+                            row, self.size = self.size, self.size + 1
+                    rows.append(row)
+                self._grow(self.size)
+                rows = np.asarray(rows, dtype=np.int64)
+                self._store_vectors(rows, vectors)
+                lists = self._assign(vectors) if self.centroids is not None else np.full(len(rows), -1)
+                self.conn.executemany("""
+                    INSERT OR REPLACE INTO chunks (row, chunk_id, source, document, metadata, list)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, [(int(row), chunk_id, (metadata or {}).get("source"), text, json.dumps(metadata or {}),
+                       int(list_id))
+                      for row, chunk_id, text, metadata, list_id in zip(rows, ids, documents, metadatas, lists)])
+                self._alive[rows] = True
+                self._assignments[rows] = lists
+                self._lists = None
+                self._commit_write()
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                self._load()
+                raise
+            live = int(self._alive.sum())
+            if self.ivf_lists and live >= self.ivf_lists * IVF_TRAIN_FACTOR and \
+                    (self.centroids is None or live >= IVF_RETRAIN_GROWTH * int(self._meta("ivf_trained", 0))):
+                self.train()
+
+    def delete(self, ids):
+        if not ids:
+            return
+        with self._lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                rows = list(self._rows_of(ids).values())
+                for batch in _batches(rows):
+                    self.conn.execute(f"DELETE FROM chunks WHERE row IN ({','.join('?' * len(batch))})", batch)
+                self._alive[rows] = False
+                self._lists = None
+                self._commit_write()
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                self._load()
+                raise
+
+    def get(self, ids):
+        found = []
+        for batch in _batches(list(ids)):
+            found.extend(self._reader().execute(
+                f"SELECT chunk_id, document, metadata FROM chunks WHERE chunk_id IN ({','.join('?' * len(batch))})",
+                batch
+            ).fetchall())
+        return [(chunk_id, text, json.loads(metadata)) for chunk_id, text, metadata in found]
+
+    def ids_for_source(self, source):
+        return [row[0] for row in self._reader().execute("SELECT chunk_id FROM chunks WHERE source = ?", (source,))]
+
+    def iter_chunks(self, page_size=1000):
+        last = -1
+        while True:
+            page = self._reader().execute("""
+                SELECT row, chunk_id, document, metadata FROM chunks WHERE row > ? ORDER BY row LIMIT ?
+            """, (last, page_size)).fetchall()
+            if not page:
+                return
+            last = page[-1][0]
+            yield [r[1] for r in page], [r[2] for r in page], [json.loads(r[3]) for r in page]
+
+    def train(self, seed: int = 0):
+        """Train the coarse index: spherical k-means on a sample, then assign every live row to a list."""
+        with self._lock:
+            live = np.flatnonzero(self._alive[:self.size])
+            if not self.ivf_lists or len(live) < self.ivf_lists:
+                return
+            rng = np.random.default_rng(seed)
+            sample = self._decode(np.sort(rng.choice(live, min(len(live), self.ivf_lists * IVF_SAMPLE_FACTOR),
+                                                     replace=False)))
+            centroids = sample[rng.choice(len(sample), self.ivf_lists, replace=False)]
+            for _ in range(IVF_ITERATIONS):
+                nearest = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, nearest, sample)
+                empty = ~sums.any(axis=1)
+                sums[empty] = centroids[empty]
+                centroids = _normalize(sums)
+
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.centroids = centroids.astype(np.float32)
+                np.save(os.path.join(self.path, "centroids.npy"), self.centroids)
+                for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                    rows = live[start:start + SEARCH_BLOCK_ROWS]
+                    lists = self._assign(self._decode(rows))
+                    self._assignments[rows] = lists
+                    self.conn.executemany("UPDATE chunks SET list = ? WHERE row = ?",
+                                          zip(lists.tolist(), rows.tolist()))
+                self._set_meta(ivf_trained=len(live))   # Vectors trained over, for retraining
+                self._lists = None
+                self._commit_write()
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                self._load()
+                raise
+            print(f"Trained vector index with {self.ivf_lists} lists over {len(live)} vectors")
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _inverted_lists(self) -> List[np.ndarray]:
+        if self._lists is None:
+            live = np.flatnonzero(self._alive[:self.size])
+            lists = self._assignments[live]
+            order = np.argsort(lists, kind="stable")
+            bounds = np.searchsorted(lists[order], np.arange(len(self.centroids) + 1))
+            self._lists = [live[order[bounds[i]:bounds[i + 1]]] for i in range(len(self.centroids))]
+        return self._lists
+
+    @staticmethod
+    def _merge_top(best_scores, best_rows, scores, rows, k):
+        """Keep the k best (score, row) pairs per query across blocks."""
+        if best_scores is not None:
+            scores = np.concatenate([best_scores, scores], axis=1)
+            rows = np.concatenate([best_rows, rows], axis=1)
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            rows = np.take_along_axis(rows, top, axis=1)
+        return scores, rows
+
+    def _exact_search(self, view: _View, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_scores = best_rows = None
+        for start in range(0, len(view.alive), SEARCH_BLOCK_ROWS):
+            stop = min(start + SEARCH_BLOCK_ROWS, len(view.alive))
+            scores = queries @ _decode(view.vectors, view.scales, slice(start, stop)).T
+            scores[:, ~view.alive[start:stop]] = -np.inf
+            rows = np.broadcast_to(np.arange(start, stop), scores.shape)
+            best_scores, best_rows = self._merge_top(best_scores, best_rows, scores, rows, k)
+        return best_scores, best_rows
+
+    def _ivf_search(self, view: _View, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        lists = view.lists
+        probes = min(self.probes, len(lists))
+        nearest = np.argpartition(-(queries @ view.centroids.T), probes - 1, axis=1)[:, :probes]
+        all_scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        all_rows = np.zeros((len(queries), k), dtype=np.int64)
+        for i, query in enumerate(queries):
+            candidates = np.sort(np.concatenate([lists[j] for j in nearest[i]]))
+            if not len(candidates):
+                continue
+            scores = _decode(view.vectors, view.scales, candidates) @ query
+            scores, rows = self._merge_top(None, None, scores[None, :], candidates[None, :], k)
+            all_scores[i, :scores.shape[1]] = scores[0]
+            all_rows[i, :rows.shape[1]] = rows[0]
+        return all_scores, all_rows
+
+    def search(self, query_vectors, k):
+        queries = _normalize(np.atleast_2d(np.asarray(query_vectors, dtype=np.float32)))
+        with self._lock:
+            self._refresh()
+            if self.vectors is None or not self._alive.any():
+                return [[] for _ in queries]
+            view = _View(self.vectors, self.scales, self._alive[:self.size].copy(), self.centroids,
+                         self._inverted_lists() if self.centroids is not None else None)
+        scores, rows = (self._ivf_search if view.centroids is not None else self._exact_search)(view, queries, k)
+        results = []
+        for query_scores, query_rows in zip(scores, rows):
+            order = np.argsort(-query_scores)
+            results.append([int(query_rows[i]) for i in order if np.isfinite(query_scores[i])])
+        chunks = self._chunks_at({row for ranked in results for row in ranked})
+        return [[chunks[row] for row in ranked if row in chunks] for ranked in results]
+
+    def _chunks_at(self, rows) -> Dict[int, Chunk]:
+        found = {}
+        for batch in _batches(list(rows)):
+            for row, chunk_id, text, metadata in self._reader().execute(
+                    f"SELECT row, chunk_id, document, metadata FROM chunks WHERE row IN ({','.join('?' * len(batch))})",
+                    batch):
+                found[row] = (chunk_id, text, json.loads(metadata))
+        return found
+
+
+def open_vector_store(backend: str = VECTOR_BACKEND, embeddings=None) -> VectorStore:
+    """The configured vector store: "chroma" or "mmap"."""
+    if backend == "chroma":
+        return ChromaVectorStore(embeddings)
+    if backend == "mmap":
+        return MmapVectorStore()
+    raise ValueError(f"Unknown vector backend: {backend}")
@@ -0,0 +1,71 @@
+import os
+import time
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from .config import PROCESSED_FOLDER, CORPUS_WATCH_INTERVAL
+
+
+# Corpus Hot Reload
+class CorpusWatcher:
+    """Polls the processed folder and ingests added, changed or removed PDFs in the background.
+
+    A change is ingested once the folder has looked the same for two polls in a
+    row, so files that are still being copied in are not picked up half written.
+    Queries keep being served while it runs: DocumentRetriever.ingest commits
+    each batch under the retriever's write lock.
+    """
+
+    def __init__(self, retriever, folder: str = PROCESSED_FOLDER, interval: float = CORPUS_WATCH_INTERVAL):
+        self.retriever = retriever
+        self.folder = folder
+        self.interval = interval
+        self.last_check: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _scan(self) -> Dict[str, Tuple[float, int]]:
+        """(mtime, size) of every PDF in the folder."""
+        if not os.path.isdir(self.folder):
+            return {}
+        snapshot = {}
+        for entry in os.scandir(self.folder):
+            if entry.name.endswith(".pdf"):
+                stat = entry.stat()
+                snapshot[entry.name] = (stat.st_mtime, stat.st_size)
+        return snapshot
+
+    def _run(self):
+        ingested, previous = None, None
+        while not self._stop.is_set():
+            current = self._scan()
+            self.last_check = time.time()
+            if current == previous and current != ingested:
+                try:
+                    stats = self.retriever.ingest()
+                    if stats["files"] or stats["removed_files"]:
+                        print(f"[watcher] Ingested {stats['files']} files, removed {stats['removed_files']}; "
+                              f"corpus version {self.retriever.corpus_version}")
+                except Exception as e:
+                    print(f"[watcher] Ingestion failed: {e}")
+                # Failed files are retried once the folder changes again
+                ingested = current
+            previous = current
+            self._stop.wait(self.interval)
+
+    def start(self) -> "CorpusWatcher":
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="corpus-watcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def status(self) -> Dict[str, Any]:
+        """Corpus version and ingestion state of the retriever, plus when the folder was last checked."""
+        return {**self.retriever.ingest_status(), "watching": bool(self._thread and self._thread.is_alive()),
+                "last_check": self.last_check}